@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# Stand-in for the its-reach binary so check_system_safety can be benchmarked
+# without ITS-Tool. Accepts the same arguments the backend passes
+# (-i <gal file> -t GAL [-reachable <formula>]), answers [reachable] properties
+# written into the GAL file as well, and prints verdicts in its-reach's format.
+# The state space is explored with the native engine, stopping after
+# ITS_STUB_MAX_STATES states; properties not found by then are reported false,
+# so the backend never falls back to one run per marking.
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulator import PetriNetSimulator
+from reachability import ReachabilityExplorer
+
+_PROPERTY = re.compile(r"^\s*property (\w+) \[reachable\] : (.*);\s*$", re.M)
+
+
+def parse_formula(formula):
+    target = {}
+    for part in formula.split("&&"):
+        place, value = part.split("==")
+        target[place.strip()] = int(value)
+    return target
+
+
+def main(argv):
+    gal_file = argv[argv.index("-i") + 1]
+    with open(gal_file) as f:
+        gal_code = f.read()
+
+    properties = [(name, formula) for name, formula in _PROPERTY.findall(gal_code)]
+    if "-reachable" in argv:
+        properties.append(("p0", argv[argv.index("-reachable") + 1]))
+    gal_code = _PROPERTY.sub("", gal_code)
+
+    simulator = PetriNetSimulator(gal_code)
+    explorer = ReachabilityExplorer(simulator.net)
+    found = explorer.search([parse_formula(formula) for _, formula in properties],
+                            max_states=int(os.environ.get("ITS_STUB_MAX_STATES", 20000)))
+
+    print(f"Total reachable states : {explorer.explored_states}")
+    for i, (name, _) in enumerate(properties):
+        print(f"Reachability property {name} is {'true' if i in found else 'false'}.")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,229 @@
+# Times each stage of the its_tool_be pipeline on synthetic specs and reports
+# peak memory, as JSON. With --baseline, every stage is compared against an
+# earlier results file and the exit status is 1 if any stage regressed.
+#
+#   python benchmarks/run_benchmarks.py --output baseline.json
+#   python benchmarks/run_benchmarks.py --baseline baseline.json
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import its_runner
+import its_tool_be
+from simulator import PetriNetSimulator
+from synthetic_spec import generate_spec
+
+SUITE = {
+    "small": dict(agent_states=4, actions=2, agent_transitions=10, environment_transitions=4, actions_per_transition=2),
+    "medium": dict(agent_states=8, actions=4, agent_transitions=60, environment_transitions=20, actions_per_transition=3),
+    "large": dict(agent_states=12, actions=6, agent_transitions=200, environment_transitions=60, actions_per_transition=4),
+}
+DEFAULT_CONFIGS = ("small", "medium")
+SPEC_PARAMETERS = ("agent_states", "actions", "agent_transitions", "environment_transitions", "actions_per_transition")
+STAGES = ("readInput", "generateGlobalTransitions", "globalToGalTransitions", "generateGalCode",
+          "check_system_safety", "simulate")
+
+
+class Timer:
+    def __init__(self):
+        self.seconds = {}
+
+    def __call__(self, stage, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.seconds[stage] = time.perf_counter() - start
+        return result
+
+
+# Peak Python heap allocated during each stage. Runs separately from the timed
+# passes because tracing allocations slows everything down.
+class MemoryMeter:
+    def __init__(self):
+        self.peak_bytes = {}
+
+    def __call__(self, stage, fn):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        self.peak_bytes[stage] = tracemalloc.get_traced_memory()[1] - base
+        return result
+
+
+def run_pipeline(text, workdir, options, measure):
+    request_id = f"bench-{uuid.uuid4().hex[:8]}"
+    its_tool_be.update_log.open(request_id)
+    try:
+        spec = measure("readInput", lambda: its_tool_be.readInput(text, request_id))
+        globalTransitions = measure("generateGlobalTransitions", lambda: its_tool_be.generateGlobalTransitions(
+            spec, spec.environment_transitions, request_id))
+        galVariables = its_tool_be.initializeGalVariables(spec.agent_states, spec.environment_states,
+                                                          spec.names.names[spec.environment_initial], request_id)
+        galTransitions, unsafeMarkings = measure("globalToGalTransitions", lambda: its_tool_be.globalToGalTransitions(
+            globalTransitions, spec, request_id))
+        gal_file, _ = measure("generateGalCode", lambda: its_tool_be.generateGalCode(
+            "testing", galVariables, galTransitions, request_id, workdir))
+        unsafe, _ = measure("check_system_safety", lambda: its_tool_be.check_system_safety(
+            unsafeMarkings, request_id, options.engine, galVariables, galTransitions, not options.per_marking, gal_file=gal_file))
+
+        with open(gal_file) as f:
+            gal_code = f.read()
+
+        def simulate():
+            simulator = PetriNetSimulator(gal_code)
+            return simulator.simulate(max_steps=options.simulate_steps, rng=random.Random(options.seed))
+        measure("simulate", simulate)
+
+        return {
+            "agentTransitions": len(spec.agent_transitions),
+            "globalTransitions": len(globalTransitions),
+            "galTransitions": len(galTransitions),
+            "unsafeMarkings": len(unsafeMarkings),
+            "unsafe": unsafe,
+        }
+    finally:
+        its_tool_be.update_log.remove(request_id)
+
+
+def benchmark(name, parameters, options):
+    text = generate_spec(seed=options.seed, **parameters)
+    runs = {stage: [] for stage in STAGES}
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        for _ in range(options.repeat):
+            timer = Timer()
+            counts = run_pipeline(text, workdir, options, timer)
+            for stage in STAGES:
+                runs[stage].append(timer.seconds[stage])
+
+        meter = MemoryMeter()
+        tracemalloc.start()
+        try:
+            run_pipeline(text, workdir, options, meter)
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "name": name,
+        "parameters": parameters,
+        "counts": counts,
+        "stages": {stage: {"seconds": statistics.median(runs[stage]), "runs": runs[stage],
+                           "peak_bytes": meter.peak_bytes[stage]} for stage in STAGES},
+    }
+
+
+# A stage regresses when it got slower (or its peak memory grew) by more than
+# `tolerance`, ignoring stages faster than min_seconds in both runs.
+def compare(results, baseline, tolerance, min_seconds):
+    previous = {result["name"]: result for result in baseline["results"]}
+    comparison = []
+    for result in results:
+        before = previous.get(result["name"])
+        if before is None or before["parameters"] != result["parameters"]:
+            continue
+        for stage, current in result["stages"].items():
+            old = before["stages"].get(stage)
+            if old is None:
+                continue
+            slower = (current["seconds"] > old["seconds"] * (1 + tolerance)
+                      and max(current["seconds"], old["seconds"]) >= min_seconds)
+            bigger = current["peak_bytes"] > old["peak_bytes"] * (1 + tolerance) and current["peak_bytes"] - old["peak_bytes"] > 1024 * 1024
+            comparison.append({
+                "name": result["name"],
+                "stage": stage,
+                "baseline_seconds": old["seconds"],
+                "seconds": current["seconds"],
+                "ratio": current["seconds"] / old["seconds"] if old["seconds"] else None,
+                "baseline_peak_bytes": old["peak_bytes"],
+                "peak_bytes": current["peak_bytes"],
+                "regression": slower or bigger,
+            })
+    return comparison
+
+
+def print_summary(results, comparison, out):
+    for result in results:
+        print(f"{result['name']}: {result['counts']}", file=out)
+        for stage, timing in result["stages"].items():
+            print(f"  {stage:28} {timing['seconds'] * 1000:10.2f} ms {timing['peak_bytes'] / 1024:10.1f} KiB", file=out)
+    for row in comparison:
+        if row["regression"]:
+            print(f"REGRESSION {row['name']}/{row['stage']}: {row['baseline_seconds'] * 1000:.2f} ms -> {row['seconds'] * 1000:.2f} ms, "
+                  f"{row['baseline_peak_bytes'] / 1024:.1f} KiB -> {row['peak_bytes'] / 1024:.1f} KiB", file=out)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", action="append", choices=sorted(SUITE),
+                        help=f"named spec size to run, repeatable (default: {', '.join(DEFAULT_CONFIGS)})")
+    for parameter in SPEC_PARAMETERS:
+        parser.add_argument(f"--{parameter.replace('_', '-')}", type=int,
+                            help="run one custom spec, other sizes default to the small config")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per spec; the median is reported")
+    parser.add_argument("--engine", choices=its_tool_be.SAFETY_ENGINES, default="its")
+    parser.add_argument("--per-marking", action="store_true",
+                        help="run its-reach once per unsafe marking instead of once for all of them")
+    parser.add_argument("--its-max-states", type=int, default=1000,
+                        help="states the its-reach stand-in explores before giving up on a property")
+    parser.add_argument("--simulate-steps", type=int, default=1000)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a stage counts as regressed")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="ignore stages faster than this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    its_runner.ITS_REACH = os.path.join(BENCHMARKS_DIR, "its_reach_stub.py")
+    os.environ["ITS_STUB_MAX_STATES"] = str(options.its_max_states)
+
+    custom = {parameter: getattr(options, parameter) for parameter in SPEC_PARAMETERS
+              if getattr(options, parameter) is not None}
+    if custom:
+        configs = [("custom", dict(SUITE["small"], **custom))]
+    else:
+        configs = [(name, SUITE[name]) for name in options.config or DEFAULT_CONFIGS]
+
+    results = [benchmark(name, parameters, options) for name, parameters in configs]
+    comparison = []
+    if options.baseline:
+        with open(options.baseline) as f:
+            comparison = compare(results, json.load(f), options.tolerance, options.min_seconds)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.time(),
+        "options": {"seed": options.seed, "repeat": options.repeat, "engine": options.engine,
+                    "per_marking": options.per_marking, "its_max_states": options.its_max_states,
+                    "simulate_steps": options.simulate_steps},
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "max_child_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "results": results,
+        "comparison": comparison,
+    }
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    print_summary(results, comparison, sys.stderr)
+    return 1 if any(row["regression"] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
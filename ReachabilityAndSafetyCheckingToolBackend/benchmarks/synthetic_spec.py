@@ -0,0 +1,48 @@
+import random
+
+
+# Writes a random spec in the its_tool_be dialect. Agent transitions are mostly
+# drawn from the keys the environment transitions look up, so a useful share of
+# the agent action combinations turn into global transitions; the rest are noise
+# that generation has to reject. The last agent state is unsafe.
+def generate_spec(agent_states=4, actions=2, agent_transitions=10, environment_transitions=4,
+                  actions_per_transition=2, environment_states=3, environment_actions=1, seed=0):
+    rng = random.Random(seed)
+    states = [f"l{i}" for i in range(agent_states)]
+    agentActions = [f"a{i + 1}" for i in range(actions)]
+    environmentStates = [f"le{i}" for i in range(environment_states)]
+    environmentActions = [f"b{i}" for i in range(environment_actions)]
+    actions_per_transition = min(actions_per_transition, actions)
+
+    environmentTransitions = []
+    for _ in range(environment_transitions):
+        environmentTransitions.append((rng.choice(environmentStates), rng.choice(environmentActions),
+                                       sorted(rng.sample(agentActions, actions_per_transition)),
+                                       rng.choice(environmentStates)))
+
+    lines = ["# agent information", ""]
+    lines.append(", ".join(f"{state}: {0 if i == agent_states - 1 else 1}" for i, state in enumerate(states)))
+    lines.append(", ".join(agentActions))
+    for state in states[:-1]:
+        lines.append(f"{state}: {', '.join(rng.sample(agentActions, rng.randint(1, actions)))}")
+
+    for _ in range(agent_transitions):
+        if rng.random() < 0.9:
+            _, environmentAction, agentsAction, _ = rng.choice(environmentTransitions)
+            action = rng.choice(agentsAction)
+            others = agentsAction if rng.random() < 0.3 else [a for a in agentsAction if a != action]
+        else:
+            environmentAction = rng.choice(environmentActions)
+            action = rng.choice(agentActions)
+            others = sorted(rng.sample(agentActions, rng.randint(0, actions)))
+        lines.append(f"{rng.choice(states[:-1])},{action},{environmentAction},{' '.join(others)},{rng.choice(states)}")
+
+    lines += [states[0], states[min(1, agent_states - 1)], "", "# environment information", ""]
+    lines.append(", ".join(environmentStates))
+    lines.append(", ".join(environmentActions))
+    for state in environmentStates:
+        lines.append(f"{state}: {', '.join(environmentActions)}")
+    lines.append(environmentStates[0])
+    for before, environmentAction, agentsAction, after in environmentTransitions:
+        lines.append(f"{before},{environmentAction},{' '.join(agentsAction)},{after}")
+    return "\n".join(lines) + "\n"
@@ -1,224 +1,60 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response
+import io
 import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
 from flask_cors import CORS
-# from simulator import PetriNetSimulator
-import random
-import copy
+from simulator import PetriNetSimulator, StatisticsObserver
+from monte_carlo import run_monte_carlo, MAX_WALKS
+from pipeline_cache import cache_key, cache_from_environment
+from spec_parser import parse_spec
+from metrics import JobMetrics, MetricsRegistry
+from state_store import VisitedStore, store_options_from_environment
 
 
 
 app = Flask(__name__)
 CORS(app)
 
-class PetriNetSimulator:
-    def __init__(self, gal_code):
-        self.variables = {}  
-        self.transitions = {} 
-        self._parse_gal_code(gal_code)
-
-    def _parse_gal_code(self, gal_code):
-        lines = gal_code.strip().splitlines()
-        current_transition = None
-
-        print("Parsing GAL code...\n")
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.startswith("int"):
-                var, val = line.replace(";", "").split("=")
-                var_name = var.split()[1].strip()
-                self.variables[var_name] = int(val.strip())
-                print(f"Declared variable: {var_name} = {self.variables[var_name]}")
-
-            elif line.startswith("transition"):
-                name = line.split("transition")[1].split("[")[0].strip()
-                guard = line.split("[")[1].split("]")[0].strip()
-                current_transition = name
-                self.transitions[name] = (guard, [])
-                print(f"\nFound transition: {name} with guard: '{guard}'")
-
-            elif current_transition and ";" in line:
-                actions = []
-                for action in line.split(";"):
-                    action = action.strip()
-                    if action:
-                        actions.append(action)
-                        print(f"  Parsed action: {action}")
-                self.transitions[current_transition] = (self.transitions[current_transition][0], actions)
-
-        print("\nFinished parsing.\n")
-
-    def _evaluate_guard(self, guard, marking):
-        print(f"  Evaluating guard: '{guard}' with marking: {marking}")
-        if guard.lower() == "true":
-            print("    Guard is 'true' → passes ✅")
-            return True
-
-        for condition in guard.split("&&"):
-            condition = condition.strip()
-            if ">=" in condition:
-                var, val = condition.split(">=")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) < int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) < {val}")
-                    return False
-            elif "<=" in condition:
-                var, val = condition.split("<=")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) > int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) > {val}")
-                    return False
-            elif "==" in condition:
-                var, val = condition.split("==")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) != int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) != {val}")
-                    return False
-            elif "!=" in condition:
-                var, val = condition.split("!=")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) == int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) == {val}")
-                    return False
-            elif ">" in condition:
-                var, val = condition.split(">")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) <= int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) <= {val}")
-                    return False
-            elif "<" in condition:
-                var, val = condition.split("<")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) >= int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) >= {val}")
-                    return False
-
-        print("    Guard passed ✅")
-        return True
-
-    def _apply_actions(self, actions, marking):
-        print(f"  Applying actions: {actions} to marking: {marking}")
-        result = copy.deepcopy(marking)
-        for action in actions:
-            if "+=" in action:
-                var, val = action.split("+=")
-                var, val = var.strip(), val.strip()
-                result[var] = result.get(var, 0) + int(val)
-                print(f"    {var} += {val} → {result[var]}")
-            elif "-=" in action:
-                var, val = action.split("-=")
-                var, val = var.strip(), val.strip()
-                result[var] = result.get(var, 0) - int(val)
-                print(f"    {var} -= {val} → {result[var]}")
-        return result
-
-    def _get_fireable_transitions(self, marking):
-        print("\nChecking fireable transitions...")
-        fireable = []
-        for name, (guard, actions) in self.transitions.items():
-            print(f" Checking transition: {name}")
-            if self._evaluate_guard(guard, marking):
-                new_marking = self._apply_actions(actions, marking)
-                if all(v >= 0 for v in new_marking.values()):
-                    fireable.append((name, new_marking))
-                    print(f"  ✅ Transition {name} is fireable.")
-                else:
-                    print(f"  ❌ Transition {name} leads to negative values → skipped.")
-            else:
-                print(f"  ❌ Guard for {name} not satisfied → skipped.")
-        return fireable
-
-    def simulate(self, max_steps=100):
-        current = copy.deepcopy(self.variables)
-        trace = [("initial", copy.deepcopy(current))]
-
-        print("\n===== Starting Simulation =====\n")
-        print(f"Initial marking: {current}\n")
-
-        for step in range(max_steps):
-            print(f"\n--- Step {step+1} ---")
-            fireable = self._get_fireable_transitions(current)
-
-            if not fireable:
-                print("No fireable transitions. Simulation halts.\n")
-                break
-
-            transition_name, next_marking = random.choice(fireable)
-            print(f"\n🔥 Firing transition: {transition_name}")
-            print(f"New marking: {next_marking}")
-            trace.append((transition_name, copy.deepcopy(next_marking)))
-            current = next_marking
-
-        print("\n===== Simulation Finished =====\n")
-        return trace
-
-
-
-def process_input_data(input_text):
-    with open("input.txt", "w") as file:
-        file.write(input_text)
-    
-    with open("input.txt", "r") as file:
-        lines = [line.strip() for line in file if line.strip() and not line.startswith("#")]
-
-    agentStates = lines[0].split()
-    agentActions = lines[1].split()
-
-    agentProtocols = {}
-    idx = 2
-    while ":" in lines[idx]:
-        state, actions = lines[idx].split(":")
-        agentProtocols[state.strip()] = [action.strip() for action in actions.split(",")]
-        idx += 1
-
-    agentTransactions = {}
-    while "," in lines[idx]:
-        parts = lines[idx].split(",")
-        actions = [action.strip() for action in parts[3].split()]
-        actions.sort()
-        keyVal = parts[1].strip() + ',' + parts[2].strip() + ',' + " ".join(actions)
-        if keyVal in agentTransactions:
-            agentTransactions[keyVal].append([parts[0].strip(), parts[4].strip()])
-        else:
-            agentTransactions[keyVal] = [[parts[0].strip(), parts[4].strip()]]
-        idx += 1
-
-    agentInitialState = lines[idx]
-    idx += 1
-    agentLeaveState = lines[idx]
-    idx += 1
-
-    environmentStates = lines[idx].split()
-    idx += 1
-    environmentActions = lines[idx].split()
-    idx += 1
-
-    environmentProtocols = {}
-    while ":" in lines[idx]:
-        state, actions = lines[idx].split(":")
-        environmentProtocols[state.strip()] = [action.strip() for action in actions.split(",")]
-        idx += 1
-
-    environmentInitialState = lines[idx]
-    idx += 1
-
-    environmentTransactions = []
-    while idx < len(lines):
-        environmentTransactions.append([value.strip() for value in lines[idx].split(",")])
-        idx += 1
-
-    globalTransitions = []
-    for environmentTransition in environmentTransactions:
-        environmentBeforeState = environmentTransition[0]
-        environmentAction = environmentTransition[1]
-        agentsAction = environmentTransition[2].split()
-        agentsAction = [a.strip() for a in agentsAction]
-        environmentFinalState = environmentTransition[3]
-
-        agentsAction.sort()
+pipeline_cache = cache_from_environment()
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 1))
+metrics_registry = MetricsRegistry("fyp")
+TRACE_FORMATS = ("full", "compact", "binary")
+VISITED_HOT_STATES, VISITED_SPILL_DIR = store_options_from_environment()
+SEARCH_MAX_STATES = int(os.environ.get("SEARCH_MAX_STATES", 100000))
+
+def process_input_data(input_text, workers=1, metrics=None):
+    if metrics is None:
+        metrics = JobMetrics()
+    with metrics.stage("parse"):
+        spec = parse_spec(input_text, "fyp")
+
+    galVariables = {state: 0 for state in list(spec.agent_states) + spec.environment_states}
+    galVariables[spec.names.names[spec.environment_initial]] = 1
+
+    if workers > 1 and len(spec.environment_transitions) > 1:
+        globalTransitions = iter_global_transitions_parallel(spec, workers)
+    else:
+        globalTransitions = iter_global_transitions(spec, spec.environment_transitions)
+    globalTransitions = metrics.timed("globalTransitions", globalTransitions)
+    galTransitions = metrics.timed("galTransitions", iter_gal_transitions(globalTransitions, spec),
+                                   exclude=("globalTransitions",))
+    out = io.StringIO()
+    with metrics.stage("galCode", exclude=("globalTransitions", "galTransitions")):
+        count = write_gal_code(out, galVariables, galTransitions)
+    metrics.count("galTransitions", count)
+    return out.getvalue()
+
+
+# Global transitions hold the state and action IDs of the spec.
+def iter_global_transitions(spec, environmentTransitions):
+    transitionIndex = spec.transition_index
+    for environmentTransition in environmentTransitions:
+        environmentBeforeState = environmentTransition.before
+        environmentAction = environmentTransition.action
+        agentsAction = environmentTransition.agent_actions
+        environmentFinalState = environmentTransition.after
+
         actionCombination = []
         for action in agentsAction:
             actionCombination.append([[action], [action, action]])
@@ -229,11 +65,11 @@ def process_input_data(input_text):
             validTransition = True
 
             for action in flattenedCombination:
-                withoutAct = " ".join(a for a in flattenedCombination if a != action)
+                withoutAct = tuple(a for a in flattenedCombination if a != action)
 
-                transitionKey = action + ',' + environmentAction + ',' + withoutAct
-                if transitionKey in agentTransactions:
-                    actionStates.append(agentTransactions[transitionKey])
+                states = transitionIndex.get((action, environmentAction), {}).get(withoutAct)
+                if states:
+                    actionStates.append(states)
                 else:
                     validTransition = False
                     break
@@ -244,17 +80,31 @@ def process_input_data(input_text):
                     agentTakenActions = flattenedCombination
                     agentFinalStates = [localTransition[1] for localTransition in gTransition]
 
-                    globalTransition = [agentBeforeStates, agentTakenActions, environmentBeforeState, environmentAction,
-                                        agentsAction, agentFinalStates, environmentFinalState]
-                    globalTransitions.append(globalTransition)
+                    yield [agentBeforeStates, agentTakenActions, environmentBeforeState, environmentAction,
+                           agentsAction, agentFinalStates, environmentFinalState]
+
+
+def global_transitions_shard(spec, environmentTransitions):
+    return list(iter_global_transitions(spec, environmentTransitions))
+
 
-    galVariables = {state: 0 for state in agentStates + environmentStates}
-    galVariables[environmentInitialState] = 1
+# Contiguous shards of environment transitions, merged back in input order, so
+# the output is the same as iter_global_transitions.
+def iter_global_transitions_parallel(spec, workers):
+    environmentTransitions = spec.environment_transitions
+    size = -(-len(environmentTransitions) // (workers * 4))
+    shards = [environmentTransitions[i:i + size] for i in range(0, len(environmentTransitions), size)]
+    with ProcessPoolExecutor(workers) as executor:
+        for globalTransitions in executor.map(global_transitions_shard, itertools.repeat(spec), shards):
+            yield from globalTransitions
 
-    galTransitions = {
-        "initialTrans": ("true", f"{agentInitialState} += 1;"),
-        "leaveTrans": (f"{agentLeaveState} > 0", f"{agentLeaveState} -= 1;")
-    }
+
+def iter_gal_transitions(globalTransitions, spec):
+    names = spec.names.names
+    agentInitialState = names[spec.agent_initial]
+    agentLeaveState = names[spec.agent_leave]
+    yield "initialTrans", ("true", f"{agentInitialState} += 1;")
+    yield "leaveTrans", (f"{agentLeaveState} > 0", f"{agentLeaveState} -= 1;")
 
     i = 1
     for globalTransition in globalTransitions:
@@ -266,33 +116,58 @@ def process_input_data(input_text):
         for state in globalTransition[5]:
             finalStateWeight[state] = finalStateWeight.get(state, 0) + 1
 
-        transitionConditions = [f"{state} >= {weight}" for state, weight in initialStateWeight.items()]
+        transitionConditions = [f"{names[state]} >= {weight}" for state, weight in initialStateWeight.items()]
         galTransitionCondition = " && ".join(transitionConditions)
 
-        actions1 = [f"{state} -= {weight};" for state, weight in initialStateWeight.items()]
-        actions2 = [f"{state} += {weight};" for state, weight in finalStateWeight.items()]
+        actions1 = [f"{names[state]} -= {weight};" for state, weight in initialStateWeight.items()]
+        actions2 = [f"{names[state]} += {weight};" for state, weight in finalStateWeight.items()]
         galActions = " ".join(actions1 + actions2)
 
-        galTransitions[f"t{i}"] = (galTransitionCondition, galActions)
+        yield f"t{i}", (galTransitionCondition, galActions)
         i += 1
 
-    gal_code = "gal generatedCode {\n"
+
+def write_gal_code(out, galVariables, galTransitions):
+    out.write("gal generatedCode {\n")
     for var, value in galVariables.items():
-        gal_code += f" int {var} = {value};\n"
+        out.write(f" int {var} = {value};\n")
+
+    count = 0
+    for transition_name, (condition, actions) in galTransitions:
+        out.write(f"\n transition {transition_name} [{condition}] {{\n {actions}\n }}\n")
+        count += 1
 
-    for transition_name, (condition, actions) in galTransitions.items():
-        gal_code += f"\n transition {transition_name} [{condition}] {{\n {actions}\n }}\n"
+    out.write("}\n")
+    return count
 
-    gal_code += "}\n"
 
+def cached_gal_code(input_text, metrics):
+    key = cache_key("fyp", input_text)
+    cached = pipeline_cache.get(key)
+    if cached:
+        return cached["galCode"]
+    gal_code = process_input_data(input_text, GENERATION_WORKERS, metrics)
+    pipeline_cache.put(key, {"galCode": gal_code})
     return gal_code
 
 
+def trace_response(trace, trace_format, **fields):
+    if trace_format == "binary":
+        return Response(trace.to_binary(), mimetype="application/octet-stream")
+    fields["trace"] = trace.to_full() if trace_format == "full" else trace.to_json()
+    response = make_response(jsonify(fields), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
 @app.route("/process", methods=["POST"])
 def process():
     data = request.json
     input_text = data.get("input_text", "")
-    gal_code = process_input_data(input_text)
+    metrics = JobMetrics()
+    with metrics.stage("total"):
+        gal_code = cached_gal_code(input_text, metrics)
+    metrics_registry.record(metrics)
     return jsonify({"gal_code": gal_code})
 
 
@@ -304,18 +179,82 @@ def simulate():
     data = request.get_json()
     input_text = data.get("input_text", "")
     no_of_branches=int(data.get("no_of_branches",25))
-
-
-    gal_code = process_input_data(input_text);
-    simulator = PetriNetSimulator(gal_code)
-    print("pranav special: ",gal_code);
-
-    trace = simulator.simulate(max_steps=no_of_branches)
-
-    response = make_response(jsonify({"trace": trace}), 200)
-    response.headers["Content-Type"] = "application/json"
-    return response
-
+    trace_format = data.get("trace_format", "full")
+    if trace_format not in TRACE_FORMATS:
+        return make_response(jsonify({"error": f"trace_format must be one of {list(TRACE_FORMATS)}."}), 400)
+
+
+    metrics = JobMetrics()
+    gal_code = cached_gal_code(input_text, metrics)
+
+    if data.get("mode") == "monte_carlo":
+        walks = int(data.get("walks", 1000))
+        if walks < 1 or walks > MAX_WALKS:
+            return make_response(jsonify({"error": f"walks must be between 1 and {MAX_WALKS}."}), 400)
+
+        targets = list(data.get("unsafe_markings", []))
+        if data.get("final_values"):
+            targets.append(data["final_values"])
+
+        workers = data.get("workers")
+        with metrics.stage("monteCarlo"):
+            statistics = run_monte_carlo(gal_code, walks=walks, max_steps=no_of_branches,
+                                         seed=int(data.get("seed", 0)),
+                                         workers=min(int(workers), os.cpu_count() or 1) if workers else None,
+                                         targets=targets)
+        metrics.count("walks", walks)
+        metrics_registry.record(metrics)
+        return make_response(jsonify({"statistics": statistics}), 200)
+
+    if data.get("mode") == "search":
+        target = data.get("target") or data.get("final_values")
+        if not target:
+            return make_response(jsonify({"error": "A target marking is required."}), 400)
+        weight = float(data.get("weight", 1))
+        if weight < 1:
+            return make_response(jsonify({"error": "weight must be at least 1."}), 400)
+
+        # A request can lower the expansion limit but not raise it above SEARCH_MAX_STATES.
+        max_states = min(int(data.get("max_states", SEARCH_MAX_STATES)), SEARCH_MAX_STATES)
+
+        simulator = PetriNetSimulator(gal_code)
+        with metrics.stage("search"):
+            try:
+                trace = simulator.search_trace(target, max_states=max_states, weight=weight)
+            except ValueError as e:
+                return make_response(jsonify({"error": str(e)}), 400)
+        metrics.count("searchExpanded", simulator.search_expanded)
+        metrics_registry.record(metrics)
+        if trace is None:
+            # reachable is null when max_states ran out before the search was decided.
+            return make_response(jsonify({"trace": None, "reachable": False if simulator.search_exhausted else None,
+                                          "expanded": simulator.search_expanded}), 200)
+        return trace_response(trace, trace_format, reachable=True, expanded=simulator.search_expanded)
+
+    # Without "statistics" the walk runs with no observer attached; steps and
+    # deadlocks follow from the trace itself.
+    fields = {}
+    with metrics.stage("simulate"):
+        simulator = PetriNetSimulator(gal_code)
+        if data.get("statistics"):
+            with VisitedStore(len(simulator.net.places), VISITED_HOT_STATES, VISITED_SPILL_DIR) as visited:
+                statistics = StatisticsObserver(visited)
+                trace = simulator.simulate_compact(max_steps=no_of_branches, observers=[statistics])
+                fields["statistics"] = statistics.summary()
+            metrics.observe("distinctMarkings", fields["statistics"]["distinct_markings"])
+        else:
+            trace = simulator.simulate_compact(max_steps=no_of_branches)
+    steps = len(trace) - 1
+    metrics.count("simulationSteps", steps)
+    metrics.count("deadlocks", int(steps < no_of_branches))
+    metrics_registry.record(metrics)
+    return trace_response(trace, trace_format, **fields)
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    gauges = {f"cache_{name}": value for name, value in pipeline_cache.stats().items()}
+    return Response(metrics_registry.render(gauges), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
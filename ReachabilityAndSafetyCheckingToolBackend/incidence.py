@@ -0,0 +1,306 @@
+import operator
+from fractions import Fraction
+from math import gcd, lcm
+
+import numpy as np
+
+UNBOUNDED = np.iinfo(np.int64).max
+
+
+# Pre/post incidence matrices (places x transitions) for a compiled GAL net
+# (simulator.CompiledNet). A transition is enabled exactly when the net's
+# is_enabled says so: its guard holds and firing it leaves no place negative.
+class IncidenceEngine:
+    def __init__(self, net):
+        self.net = net
+        self.places = net.places
+        self.transition_names = [t.name for t in net.transitions]
+
+        num_places = len(net.places)
+        num_transitions = len(net.transitions)
+
+        self.pre = np.zeros((num_places, num_transitions), dtype=np.int64)
+        self.post = np.zeros((num_places, num_transitions), dtype=np.int64)
+        self.lower = np.zeros((num_transitions, num_places), dtype=np.int64)
+        self.upper = np.full((num_transitions, num_places), UNBOUNDED, dtype=np.int64)
+        not_equal = []
+
+        for t, transition in enumerate(net.transitions):
+            for idx, amount in transition.effects:
+                if amount < 0:
+                    self.pre[idx, t] -= amount
+                else:
+                    self.post[idx, t] += amount
+
+            for idx, comparator, constant in transition.guard:
+                if comparator is operator.ge:
+                    self.lower[t, idx] = max(self.lower[t, idx], constant)
+                elif comparator is operator.gt:
+                    self.lower[t, idx] = max(self.lower[t, idx], constant + 1)
+                elif comparator is operator.le:
+                    self.upper[t, idx] = min(self.upper[t, idx], constant)
+                elif comparator is operator.lt:
+                    self.upper[t, idx] = min(self.upper[t, idx], constant - 1)
+                elif comparator is operator.eq:
+                    self.lower[t, idx] = max(self.lower[t, idx], constant)
+                    self.upper[t, idx] = min(self.upper[t, idx], constant)
+                else:
+                    not_equal.append((t, idx, constant))
+
+        self.incidence = self.post - self.pre
+        # Row t is the marking change of firing t; the net effect must not go negative.
+        self.delta = np.ascontiguousarray(self.incidence.T)
+        self.lower = np.maximum(self.lower, -self.delta)
+        self.not_equal = not_equal
+        self.initial_marking = np.array(net.initial_marking, dtype=np.int64)
+
+    @classmethod
+    def from_simulator(cls, simulator):
+        return cls(simulator.net)
+
+    def enabled(self, marking):
+        return self.enabled_batch(np.asarray(marking, dtype=np.int64)[None, :])[0]
+
+    def enabled_batch(self, markings):
+        markings = np.asarray(markings, dtype=np.int64)
+        m = markings[:, None, :]
+        enabled = np.all((m >= self.lower) & (m <= self.upper), axis=2)
+        for t, idx, constant in self.not_equal:
+            enabled[:, t] &= markings[:, idx] != constant
+        return enabled
+
+    def fire(self, marking, transition):
+        return np.asarray(marking, dtype=np.int64) + self.delta[transition]
+
+    def fire_batch(self, markings, transitions):
+        return np.asarray(markings, dtype=np.int64) + self.delta[transitions]
+
+    # (indices of the enabled transitions, the marking each of them leads to)
+    def successors(self, marking):
+        marking = np.asarray(marking, dtype=np.int64)
+        fireable = np.flatnonzero(self.enabled(marking))
+        return fireable, marking + self.delta[fireable]
+
+    # Fires one uniformly chosen enabled transition in every marking. The chosen
+    # transition is -1 for deadlocked rows, which are left unchanged.
+    def step_batch(self, markings, rng):
+        markings = np.asarray(markings, dtype=np.int64)
+        enabled = self.enabled_batch(markings)
+        counts = enabled.sum(axis=1)
+
+        # Pick the k-th enabled transition per row with k uniform in [0, count).
+        picks = np.floor(rng.random(len(markings)) * counts).astype(np.int64)
+        ranks = np.cumsum(enabled, axis=1) - 1
+        chosen = np.argmax(enabled & (ranks == picks[:, None]), axis=1)
+        chosen[counts == 0] = -1
+
+        live = chosen >= 0
+        result = markings.copy()
+        result[live] += self.delta[chosen[live]]
+        return result, chosen
+
+
+# Distinct transition effects held sparsely before they are reduced to a basis.
+EFFECT_BUFFER = 4096
+
+
+# What the unsafe-marking pre-filter needs from a net, collected one transition
+# at a time, so it can follow transitions streamed into a GAL file: guard-implied
+# place bounds, which places ever gain or lose tokens, and the span of the
+# transition effects (the columns of the incidence matrix). Effects are kept as
+# sparse (place index, amount) tuples; once EFFECT_BUFFER distinct ones pile up
+# they are reduced to a basis of at most one row per place, so memory does not
+# grow with the number of transitions. `net` is a simulator.CompiledNet giving
+# the places and initial marking; places it interns later start at 0.
+class StateEquation:
+    def __init__(self, net):
+        self.net = net
+        self.initial = []
+        self.lower = []
+        self.upper = []
+        self.gains = set()
+        self.losses = set()
+        self._pending = set()
+        self._basis = []
+        self._certificates = {}
+        self._grow()
+
+    @classmethod
+    def from_net(cls, net):
+        equation = cls(net)
+        for transition in net.transitions:
+            equation.add(transition.guard, transition.changes)
+        return equation
+
+    def _grow(self):
+        initial = self.net.initial_marking
+        for idx in range(len(self.initial), len(self.net.places)):
+            value = initial[idx] if idx < len(initial) else 0
+            self.initial.append(value)
+            self.lower.append(value)
+            self.upper.append(value)
+
+    # Adds a transition with compiled guard terms and net changes. A place only
+    # grows past its initial value through transitions whose guard caps it, and
+    # only shrinks below it through transitions whose guard floors it, so the
+    # bounds hold whether or not a marking may go negative.
+    def add(self, guard, changes):
+        self._grow()
+        self._certificates = {}
+        low, high = {}, {}
+        for idx, comparator, constant in guard:
+            if comparator is operator.ge or comparator is operator.gt or comparator is operator.eq:
+                bound = constant + 1 if comparator is operator.gt else constant
+                low[idx] = max(low.get(idx, bound), bound)
+            if comparator is operator.le or comparator is operator.lt or comparator is operator.eq:
+                bound = constant - 1 if comparator is operator.lt else constant
+                high[idx] = min(high.get(idx, bound), bound)
+        for idx, amount in changes:
+            if amount > 0:
+                self.gains.add(idx)
+                if self.upper[idx] is not None:
+                    self.upper[idx] = max(self.upper[idx], high[idx] + amount) if idx in high else None
+            else:
+                self.losses.add(idx)
+                if self.lower[idx] is not None:
+                    self.lower[idx] = min(self.lower[idx], low[idx] + amount) if idx in low else None
+        if changes:
+            self._pending.add(changes)
+            if len(self._pending) >= EFFECT_BUFFER:
+                self._basis = list(_echelon(self._effects(range(len(self.initial)))).values())
+                self._pending = set()
+
+    # The basis rows and the pending effects as a matrix over the places in `order`.
+    def _effects(self, order):
+        width = len(self.initial)
+        rows = [row + [0] * (width - len(row)) for row in self._basis]
+        for changes in self._pending:
+            row = [0] * width
+            for idx, amount in changes:
+                row[idx] = amount
+            rows.append(row)
+        order = list(order)
+        try:
+            matrix = np.array(rows, dtype=np.int64).reshape(len(rows), width)[:, order]
+        except OverflowError:
+            return np.array(rows, dtype=object).reshape(len(rows), width)[:, order]
+        return np.unique(matrix, axis=0)
+
+    # Integer basis of the place invariants: vectors y with y . C == 0, so y . M is
+    # the same in every reachable marking M. Places in `last` are eliminated last,
+    # so only the basis vectors that cannot avoid them have non-zero entries there.
+    def place_invariants(self, last=()):
+        self._grow()
+        last = set(last)
+        order = [idx for idx in range(len(self.initial)) if idx not in last] + sorted(last)
+        rows = _echelon(self._effects(order))
+
+        # Back substitution to the reduced form, then one invariant per free column.
+        reduced = {}
+        for pivot in sorted(rows, reverse=True):
+            row = [Fraction(value, rows[pivot][pivot]) for value in rows[pivot]]
+            for other, basis in reduced.items():
+                if row[other]:
+                    factor = row[other]
+                    row = [a - factor * b for a, b in zip(row, basis)]
+            reduced[pivot] = row
+
+        invariants = []
+        for free in range(len(order)):
+            if free in reduced:
+                continue
+            vector = [Fraction(0)] * len(order)
+            vector[free] = Fraction(1)
+            for pivot, row in reduced.items():
+                vector[pivot] = -row[free]
+            scale = lcm(*(value.denominator for value in vector))
+            values = [int(value * scale) for value in vector]
+            divisor = gcd(*values)
+            invariant = [0] * len(order)
+            for k, idx in enumerate(order):
+                invariant[idx] = values[k] // divisor
+            invariants.append(invariant)
+        return invariants
+
+    # (lower, upper) bound of every place over all reachable markings, None where
+    # the guards do not bound it.
+    def place_bounds(self):
+        self._grow()
+        return self.lower, self.upper
+
+    # Vectors y with y . C >= 0, so y . M >= y . M0 in every reachable marking M:
+    # the place invariants with both signs, and the unit vectors of places that
+    # never lose (y = e_p) or never gain (y = -e_p) tokens.
+    def _reachability_certificates(self, open_places):
+        certificates = self._certificates.get(open_places)
+        if certificates is None:
+            certificates = []
+            for invariant in self.place_invariants(open_places):
+                certificates.append(invariant)
+                certificates.append([-value for value in invariant])
+            for idx in range(len(self.initial)):
+                unit = [0] * len(self.initial)
+                if idx not in self.losses:
+                    unit[idx] = 1
+                    certificates.append(unit)
+                elif idx not in self.gains:
+                    unit[idx] = -1
+                    certificates.append(unit)
+            certificates = [(y, sum(a * b for a, b in zip(y, self.initial))) for y in certificates]
+            self._certificates[open_places] = certificates
+        return certificates
+
+    # True if no reachable marking agrees with `target` (place -> value), checked
+    # against the place bounds and the state equation M = M0 + C x, x >= 0, through
+    # _reachability_certificates: reachable M need y . M >= y . M0. Places the target
+    # leaves open range over their bounds. False only means the check cannot tell.
+    def proves_unreachable(self, target):
+        lower, upper = self.place_bounds()
+        values = {}
+        for place, value in target.items():
+            idx = self.net.place_index.get(place)
+            if idx is None:
+                return False
+            if (lower[idx] is not None and value < lower[idx]) or (upper[idx] is not None and value > upper[idx]):
+                return True
+            values[idx] = value
+        open_places = frozenset(idx for idx in range(len(self.initial)) if idx not in values)
+
+        for y, initial in self._reachability_certificates(open_places):
+            highest = 0
+            for idx, weight in enumerate(y):
+                if not weight:
+                    continue
+                if idx in values:
+                    highest += weight * values[idx]
+                else:
+                    bound = upper[idx] if weight > 0 else lower[idx]
+                    if bound is None:
+                        break
+                    highest += weight * bound
+            else:
+                if highest < initial:
+                    return True
+        return False
+
+
+# Fraction-free row echelon form of `matrix`, one pivot column at a time, as
+# {pivot column: row}. Rows are kept divided by their gcd; entries too large for
+# int64 switch the matrix to Python ints.
+def _echelon(matrix):
+    rows = {}
+    for k in range(matrix.shape[1]):
+        nonzero = np.flatnonzero(matrix[:, k])
+        if not len(nonzero):
+            continue
+        pivot_row = matrix[nonzero[0]]
+        rows[k] = [int(value) for value in pivot_row]
+        matrix = matrix * pivot_row[k] - np.outer(matrix[:, k], pivot_row)
+        matrix = matrix[matrix.any(axis=1)]
+        if not len(matrix):
+            break
+        divisors = np.gcd.reduce(matrix, axis=1)
+        matrix = matrix // divisors[:, None]
+        if matrix.dtype != object and np.abs(matrix).max() >= 1 << 31:
+            matrix = matrix.astype(object)
+    return rows
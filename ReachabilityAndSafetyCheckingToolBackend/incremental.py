@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+from spec_parser import Interner
+
+
+# (agent action, environment action) pairs whose agentTransitions entries were
+# added, removed or changed between two parsed specs.
+def changed_transition_pairs(old_transitions, new_transitions):
+    pairs = set()
+    for key in set(old_transitions) | set(new_transitions):
+        if old_transitions.get(key) != new_transitions.get(key):
+            action, environmentAction = [part.strip() for part in key.split(",")[:2]]
+            pairs.add((action, environmentAction))
+    return pairs
+
+
+# generateGlobalTransitions only looks up agentTransitions keys starting with
+# one of the transition's agent actions and its environment action.
+def is_affected(environmentTransition, changed_pairs):
+    environmentAction = environmentTransition[1]
+    return any((action, environmentAction) in changed_pairs for action in environmentTransition[2].split())
+
+
+# Everything kept from the previous run of one editing session.
+class VerificationSession:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.names = Interner()
+        self.agentTransitions = {}
+        self.globalTransitionsByEnvironment = {}
+        self.galVariables = None
+        self.galTransitions = frozenset()
+        self.verdicts = {}
+
+    def reusable_global_transitions(self, agentTransitions, environmentTransitions):
+        changed_pairs = changed_transition_pairs(self.agentTransitions, agentTransitions)
+        reusable = {}
+        for environmentTransition in environmentTransitions:
+            key = tuple(environmentTransition)
+            if key in self.globalTransitionsByEnvironment and not is_affected(environmentTransition, changed_pairs):
+                reusable[key] = self.globalTransitionsByEnvironment[key]
+        return reusable
+
+    # Previous verdicts (keyed by reachability formula) that still hold for the new
+    # net. Reachability is monotone in the transition set: adding transitions keeps
+    # REACHABLE markings reachable, removing them keeps UNREACHABLE ones unreachable.
+    # Any other edit, or a change of places or initial marking, invalidates all of them.
+    def reusable_verdicts(self, galVariables, galTransitions):
+        if galVariables != self.galVariables:
+            return {}
+        transitions = frozenset(galTransitions.values())
+        if transitions == self.galTransitions:
+            return dict(self.verdicts)
+        if transitions > self.galTransitions:
+            return {formula: verdict for formula, verdict in self.verdicts.items() if verdict}
+        if transitions < self.galTransitions:
+            return {formula: verdict for formula, verdict in self.verdicts.items() if verdict is False}
+        return {}
+
+    def update(self, agentTransitions, globalTransitionsByEnvironment, galVariables, galTransitions, verdicts):
+        self.agentTransitions = agentTransitions
+        self.globalTransitionsByEnvironment = globalTransitionsByEnvironment
+        self.galVariables = dict(galVariables)
+        self.galTransitions = frozenset(galTransitions.values())
+        self.verdicts = {formula: verdict for formula, verdict in verdicts.items() if verdict is not None}
+
+
+# Sessions by client-chosen ID. A session is dropped `ttl` seconds after it was
+# last used, and the least recently used ones go first once there are more than
+# `max_sessions`. Sessions with a job running (their lock held) are kept; a
+# dropped session's next job just starts from scratch.
+class SessionStore:
+    def __init__(self, max_sessions, ttl):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.evicted = 0
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                session = VerificationSession()
+            session.last_used = now
+            self._sessions[session_id] = session
+
+            idle = [key for key, other in self._sessions.items()
+                    if now - other.last_used > self.ttl and not other.lock.locked()]
+            overflow = len(self._sessions) - len(idle) - self.max_sessions
+            for key, other in self._sessions.items():
+                if overflow <= 0:
+                    break
+                if key != session_id and key not in idle and not other.lock.locked():
+                    idle.append(key)
+                    overflow -= 1
+            for key in idle:
+                del self._sessions[key]
+            self.evicted += len(idle)
+            return session
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "evicted": self.evicted}
@@ -0,0 +1,129 @@
+import contextlib
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ITS_REACH = "./its-reach"
+PROPERTY_PREFIX = "unsafe"
+
+_PROPERTY_VERDICT = re.compile(r"\b" + PROPERTY_PREFIX + r"(\d+)\b.*\bis (true|false)\b")
+
+
+def reach_command(gal_file, formula=None):
+    cmd = [ITS_REACH, "-i", gal_file, "-t", "GAL"]
+    if formula is not None:
+        cmd += ["-reachable", formula]
+    return cmd
+
+
+def run_its_reach(gal_file, formula=None):
+    result = subprocess.run(reach_command(gal_file, formula), capture_output=True, text=True)
+    return result.stdout
+
+
+# Copies the GAL model and appends one [reachable] property per formula, so a
+# single its-reach run builds the state space once and answers all of them.
+def write_property_gal(gal_file, formulas):
+    property_file = os.path.splitext(gal_file)[0] + "_properties.gal"
+    with open(gal_file, "r") as f:
+        gal_code = f.read()
+    with open(property_file, "w") as f:
+        f.write(gal_code)
+        for i, formula in enumerate(formulas):
+            f.write(f"property {PROPERTY_PREFIX}{i} [reachable] : {formula};\n")
+    return property_file
+
+
+# Returns one verdict per formula: True/False, or None if its-reach did not
+# report on that property.
+def parse_property_verdicts(output, count):
+    verdicts = [None] * count
+    for line in output.split('\n'):
+        match = _PROPERTY_VERDICT.search(line)
+        if match and int(match.group(1)) < count:
+            verdicts[int(match.group(1))] = match.group(2) == "true"
+    return verdicts
+
+
+# Runs one its-reach subprocess per formula, at most `concurrency` at a time.
+# Each call is killed after `timeout` seconds; with stop_on_first the first
+# REACHABLE verdict kills the running calls and skips the queued ones.
+#
+# Statuses are "reachable", "unreachable", "timeout", "cancelled" or "error";
+# the verdict is None for the last three. A run is only "unreachable" when
+# its-reach exits cleanly and reports the property false; anything else it
+# prints (a crash, an unparsable formula) is an "error".
+#
+# With a job_scheduler.ProcessBudget, every call also waits for one of its slots
+# before starting its-reach, and the timeout only counts from the start.
+class ItsReachDispatcher:
+    def __init__(self, gal_file, concurrency=1, timeout=None, stop_on_first=False, budget=None):
+        self.gal_file = gal_file
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.stop_on_first = stop_on_first
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._running = set()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for proc in self._running:
+                proc.kill()
+
+    def _run(self, i, formula, on_start):
+        with self.budget.reserve() if self.budget is not None else contextlib.nullcontext():
+            return self._run_process(i, formula, on_start)
+
+    def _run_process(self, i, formula, on_start):
+        if self._stopped.is_set():
+            return i, "cancelled", None, ""
+
+        cmd = reach_command(self.gal_file, formula)
+        if on_start:
+            on_start(i, cmd)
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except Exception as e:
+            return i, "error", None, str(e)
+
+        with self._lock:
+            self._running.add(proc)
+        if self._stopped.is_set():
+            proc.kill()
+        try:
+            output, errors = proc.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            return i, "timeout", None, ""
+        finally:
+            with self._lock:
+                self._running.discard(proc)
+
+        if "is true" in output:
+            if self.stop_on_first:
+                self.stop()
+            return i, "reachable", True, output
+        if self._stopped.is_set() and proc.returncode != 0:
+            return i, "cancelled", None, output
+        if proc.returncode == 0 and "is false" in output:
+            return i, "unreachable", False, output
+        return i, "error", None, f"its-reach exited with status {proc.returncode}: {(errors or output).strip()}"
+
+    def run(self, formulas, on_start=None, on_result=None):
+        statuses = ["cancelled"] * len(formulas)
+        verdicts = [None] * len(formulas)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [pool.submit(self._run, i, formula, on_start) for i, formula in enumerate(formulas)]
+            for future in as_completed(futures):
+                i, status, verdict, output = future.result()
+                statuses[i] = status
+                verdicts[i] = verdict
+                if on_result:
+                    on_result(i, status, verdict, output)
+        return statuses, verdicts
@@ -1,172 +1,257 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS, cross_origin
-import subprocess
 import os
 import itertools
 import time
-import threading
-import queue
+import uuid
+import json
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from reachability import ReachabilityExplorer
+from incidence import StateEquation
+from simulator import CompiledNet
+from state_store import store_options_from_environment
+from spec_parser import parse_spec
+from pipeline_cache import cache_key, cache_from_environment
+from incremental import SessionStore
+from update_log import UpdateLog, LEVELS as LOG_LEVELS
+from job_scheduler import JobScheduler, ProcessBudget, QueueFull, job_workspace
+from its_runner import reach_command, run_its_reach, write_property_gal, parse_property_verdicts, ItsReachDispatcher
+from metrics import JobMetrics, MetricsRegistry
 
 app = Flask(__name__)
 CORS(app)
 
-processing_updates = {}
 processing_results = {}
+job_metrics = {}
+
+SAFETY_ENGINES = ("its", "native")
+MAX_ITS_CONCURRENCY = os.cpu_count() or 1
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", os.cpu_count() or 1))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 32))
+MAX_SUBPROCESSES = int(os.environ.get("MAX_SUBPROCESSES", os.cpu_count() or 1))
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 1))
+LONG_POLL_MAX_WAIT = 30
+STREAM_KEEPALIVE = 15
+GAL_WRITE_BUFFER = 1 << 16
+AGENT_BOUND = 50
+UPDATE_LOG_MAX_ENTRIES = int(os.environ.get("UPDATE_LOG_MAX_ENTRIES", 5000))
+FINISHED_JOB_TTL = int(os.environ.get("FINISHED_JOB_TTL", 3600))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 100))
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 3600))
+VISITED_HOT_STATES, VISITED_SPILL_DIR = store_options_from_environment()
+
+scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_SIZE)
+process_budget = ProcessBudget(MAX_SUBPROCESSES)
+pipeline_cache = cache_from_environment()
+verification_sessions = SessionStore(MAX_SESSIONS, SESSION_TTL)
+update_log = UpdateLog(UPDATE_LOG_MAX_ENTRIES, FINISHED_JOB_TTL,
+                       on_evict=lambda request_id: processing_results.pop(request_id, None))
+metrics_registry = MetricsRegistry("its_tool")
 
 @app.route('/process', methods=['OPTIONS'])
 def process_options():
     return jsonify({}), 200
 
 def add_update(request_id, update_type, content):
-    if request_id not in processing_updates:
-        processing_updates[request_id] = []
-    
-    processing_updates[request_id].append({
-        "type": update_type,
-        "content": content,
-        "timestamp": time.time()
-    })
+    update_log.add(request_id, update_type, content)
+
+# Counters only exist while a job runs its pipeline; calls outside one are ignored.
+def countMetric(request_id, name, amount=1):
+    metrics = job_metrics.get(request_id)
+    if metrics is not None:
+        metrics.count(name, amount)
 
-def readInput(agent_and_environment_information, request_id):
+def stageMetric(request_id, name):
+    metrics = job_metrics.get(request_id)
+    return metrics.stage(name) if metrics is not None else contextlib.nullcontext()
+
+def isFinished(request_id):
+    result = processing_results.get(request_id, {})
+    return result.get("completed", False) or "error" in result
+
+def readInput(agent_and_environment_information, request_id, names=None):
     add_update(request_id, "info", "Reading input data...")
-    lines = [line.strip() for line in agent_and_environment_information.splitlines() if line.strip() and not line.startswith("#")]
-    
-    agentStates = {}
-    for stateInfo in lines[0].split(","):
-        state, value = stateInfo.split(":")
-        agentStates[state.strip()] = int(value.strip())
-    
-    add_update(request_id, "info", f"Agent States: {agentStates}")
-    
-    agentActions = [action.strip() for action in lines[1].split(",")]
-    add_update(request_id, "info", f"Agent Actions: {agentActions}")
-    
-    agentProtocols = {}
-    idx = 2
-    while ":" in lines[idx]:
-        state, actions = lines[idx].split(":")
-        agentProtocols[state.strip()] = [action.strip() for action in actions.split(",")]
-        idx += 1
-    
-    add_update(request_id, "info", f"Agent Protocols: {agentProtocols}")
-    
-    agentTransitions = {}
-    while "," in lines[idx]:
-        parts = lines[idx].split(",")
-        actions = [action.strip() for action in parts[3].split()]
-        actions.sort()
-        keyVal = parts[1].strip() + ',' + parts[2].strip() + ',' + " ".join(actions)
-        if keyVal in agentTransitions:
-            agentTransitions[keyVal].append([parts[0].strip(), parts[4].strip()])
-        else:
-            agentTransitions[keyVal] = [[parts[0].strip(), parts[4].strip()]]
-        idx += 1
-    
-    add_update(request_id, "info", f"Agent Transitions detected: {len(agentTransitions)}")
-    
-    agentInitialState = lines[idx].strip()
-    idx += 1
-    agentLeaveState = lines[idx].strip()
-    idx += 1
-    
-    add_update(request_id, "info", f"Agent Initial State: {agentInitialState}")
-    add_update(request_id, "info", f"Agent Leave State: {agentLeaveState}")
+    spec = parse_spec(agent_and_environment_information, "its", names)
     
-    environmentStates = [state.strip() for state in lines[idx].split(",")]
-    idx += 1
-    environmentActions = [action.strip() for action in lines[idx].split(",")]
-    idx += 1
+    add_update(request_id, "info", f"Agent States: {spec.agent_states}")
+    add_update(request_id, "info", f"Agent Actions: {spec.agent_actions}")
+    add_update(request_id, "info", f"Agent Protocols: {spec.agent_protocols}")
+    add_update(request_id, "info", f"Agent Transitions detected: {sum(len(byOthers) for byOthers in spec.transition_index.values())}")
+    add_update(request_id, "info", f"Agent Initial State: {spec.names.names[spec.agent_initial]}")
+    add_update(request_id, "info", f"Agent Leave State: {spec.names.names[spec.agent_leave]}")
+    add_update(request_id, "info", f"Environment States: {spec.environment_states}")
+    add_update(request_id, "info", f"Environment Actions: {spec.environment_actions}")
+    add_update(request_id, "info", f"Environment Protocols: {spec.environment_protocols}")
+    add_update(request_id, "info", f"Environment Initial State: {spec.names.names[spec.environment_initial]}")
+    add_update(request_id, "info", f"Environment Transitions detected: {len(spec.environment_transitions)}")
     
-    add_update(request_id, "info", f"Environment States: {environmentStates}")
-    add_update(request_id, "info", f"Environment Actions: {environmentActions}")
-    
-    environmentProtocols = {}
-    while ":" in lines[idx]:
-        state, actions = lines[idx].split(":")
-        environmentProtocols[state.strip()] = [action.strip() for action in actions.split(",")]
-        idx += 1
-    
-    add_update(request_id, "info", f"Environment Protocols: {environmentProtocols}")
-    
-    environmentInitialState = lines[idx].strip()
-    idx += 1
-    
-    add_update(request_id, "info", f"Environment Initial State: {environmentInitialState}")
-    
-    environmentTransitions = []
-    while idx < len(lines):
-        environmentTransitions.append([value.strip() for value in lines[idx].split(",")])
-        idx += 1
-    
-    add_update(request_id, "info", f"Environment Transitions detected: {len(environmentTransitions)}")
-    
-    return (agentStates, agentActions, agentProtocols, agentTransitions, 
-            agentInitialState, agentLeaveState, environmentStates, environmentActions, 
-            environmentProtocols, environmentInitialState, environmentTransitions)
+    return spec
 
-def findValidCombinations(flattenedCombination, environmentAction, agentTransitions, request_id):
-    add_update(request_id, "info", f"Finding valid combinations for: {flattenedCombination}")
+def findValidCombinations(flattenedCombination, environmentAction, spec, request_id):
+    debug = update_log.enabled(request_id, "debug")
+    if debug:
+        add_update(request_id, "debug", f"Finding valid combinations for: {spec.name_list(flattenedCombination)}")
     actionStates = []
     for action in flattenedCombination:
-        withoutAct = ""
+        withoutAct = []
         i = 0
         while i < len(flattenedCombination):
             a = flattenedCombination[i]
             if a == action:
                 if i + 1 < len(flattenedCombination) and flattenedCombination[i] == flattenedCombination[i + 1]:
-                    withoutAct += a + " "
+                    withoutAct.append(a)
             else:
-                withoutAct += a + " "
+                withoutAct.append(a)
             i += 2 if i + 1 < len(flattenedCombination) and flattenedCombination[i] == flattenedCombination[i + 1] else 1
-        withoutAct = withoutAct.strip()
-        transitionKey = action + ',' + environmentAction + ',' + withoutAct
-        if transitionKey in agentTransitions:
-            actionStates.append(agentTransitions[transitionKey])
+        states = spec.transition_index.get((action, environmentAction), {}).get(tuple(withoutAct))
+        if states:
+            actionStates.append(states)
         else:
             actionStates = []
-            add_update(request_id, "warning", f"Failed local TransitionKey: {transitionKey}")
+            countMetric(request_id, "failedTransitionKeys")
+            if debug:
+                add_update(request_id, "debug", f"Failed local TransitionKey: {','.join(spec.name_list([action, environmentAction]))},{' '.join(spec.name_list(withoutAct))}")
             break
     return actionStates
 
-def generateGlobalTransitions(agentTransitions, environmentTransitions, request_id):
+# Single ([action]) and double ([action, action]) choices for every agent action,
+# each with the local transitions its agents can take, or None if some action has
+# neither. With distinct actions the key an agent looks up only depends on its own
+# action and on whether another agent shares it, so a missing key prunes every
+# combination containing that choice without enumerating them.
+def actionChoices(agentsAction, environmentAction, transitionIndex):
+    everyone = tuple(agentsAction)
+    choices = []
+    for action in agentsAction:
+        byOthers = transitionIndex.get((action, environmentAction), {})
+        others = tuple(a for a in agentsAction if a != action)
+        options = []
+        if others in byOthers:
+            options.append(([action], [byOthers[others]]))
+        if everyone in byOthers:
+            options.append(([action, action], [byOthers[everyone]] * 2))
+        if not options:
+            return None
+        choices.append(options)
+    return choices
+
+# Yields (flattenedCombination, actionStates) for the valid combinations, in the
+# order of the full single/double enumeration.
+def validCombinations(agentsAction, environmentAction, spec, request_id, debug):
+    if len(set(agentsAction)) == len(agentsAction):
+        choices = actionChoices(agentsAction, environmentAction, spec.transition_index)
+        if choices is None:
+            countMetric(request_id, "failedTransitionKeys")
+            if debug:
+                add_update(request_id, "debug", f"No valid combination for agent actions {spec.name_list(agentsAction)} with {spec.names.names[environmentAction]}")
+            return
+        tested = 0
+        for combination in itertools.product(*choices):
+            tested += 1
+            yield ([a for actions, _ in combination for a in actions],
+                   [states for _, localStates in combination for states in localStates])
+        countMetric(request_id, "combinationsTested", tested)
+        return
+
+    # Repeated agent actions merge into pairs when flattened; enumerate them fully.
+    actionCombination = []
+    for action in agentsAction:
+        actionCombination.append([[action], [action, action]])
+    for combination in itertools.product(*actionCombination):
+        flattenedCombination = [item for sublist in combination for item in sublist]
+        if debug:
+            add_update(request_id, "debug", f"Testing combination: {spec.name_list(flattenedCombination)}")
+        countMetric(request_id, "combinationsTested")
+        yield flattenedCombination, findValidCombinations(flattenedCombination, environmentAction, spec, request_id)
+
+# Yields the global transitions one at a time, so the caller decides whether
+# they are ever held in memory together. Global transitions hold state and
+# action IDs of the spec:
+# [agent before states, agent actions, environment before state, environment
+#  action, agent actions of the environment transition, agent final states,
+#  environment final state]
+def iterGlobalTransitions(spec, environmentTransitions, request_id):
     add_update(request_id, "info", "Generating global transitions...")
-    globalTransitions = []
+    debug = update_log.enabled(request_id, "debug")
+    names = spec.names.names
+    total = 0
     for i, environmentTransition in enumerate(environmentTransitions):
         add_update(request_id, "info", f"Processing environment transition {i+1}/{len(environmentTransitions)}")
-        environmentBeforeState = environmentTransition[0]
-        environmentAction = environmentTransition[1]
-        agentsAction = [a.strip() for a in environmentTransition[2].split()]
-        environmentFinalState = environmentTransition[3]
-
-        add_update(request_id, "info", f"Environment transition: {environmentBeforeState} --{environmentAction}--> {environmentFinalState}")
-
-        agentsAction.sort()
-        actionCombination = []
-        for action in agentsAction:
-            actionCombination.append([[action], [action, action]])
-
-        for combination in itertools.product(*actionCombination):
-            flattenedCombination = [item for sublist in combination for item in sublist]
-            add_update(request_id, "info", f"Testing combination: {flattenedCombination}")
-            actionStates = findValidCombinations(flattenedCombination, environmentAction, agentTransitions, request_id)
+        environmentBeforeState = environmentTransition.before
+        environmentAction = environmentTransition.action
+        agentsAction = environmentTransition.agent_actions
+        environmentFinalState = environmentTransition.after
+
+        add_update(request_id, "info", f"Environment transition: {names[environmentBeforeState]} --{names[environmentAction]}--> {names[environmentFinalState]}")
+
+        for flattenedCombination, actionStates in validCombinations(agentsAction, environmentAction, spec, request_id, debug):
             if actionStates:
                 for gTransition in itertools.product(*actionStates):
-                    agentBeforeStates = []
-                    agentTakenActions = []
-                    agentFinalStates = []
-                    i = 0
-                    for localTransition in gTransition:
-                        agentBeforeStates.append(localTransition[0])
-                        agentTakenActions.append(flattenedCombination[i])
-                        i += 1
-                        agentFinalStates.append(localTransition[1])
-                    globalTransition = [agentBeforeStates, agentTakenActions, environmentBeforeState, 
+                    agentBeforeStates = [localTransition[0] for localTransition in gTransition]
+                    agentFinalStates = [localTransition[1] for localTransition in gTransition]
+                    globalTransition = [agentBeforeStates, flattenedCombination, environmentBeforeState,
                                         environmentAction, agentsAction, agentFinalStates, environmentFinalState]
-                    globalTransitions.append(globalTransition)
-                    add_update(request_id, "success", f"Valid global transition: {agentBeforeStates} --{agentTakenActions}--> {agentFinalStates}")
+                    total += 1
+                    yield globalTransition
+                    if debug:
+                        add_update(request_id, "debug", f"Valid global transition: {spec.name_list(agentBeforeStates)} --{spec.name_list(flattenedCombination)}--> {spec.name_list(agentFinalStates)}")
     
-    add_update(request_id, "info", f"Total global transitions generated: {len(globalTransitions)}")
-    return globalTransitions
+    add_update(request_id, "info", f"Total global transitions generated: {total}")
+
+def generateGlobalTransitions(spec, environmentTransitions, request_id):
+    return list(iterGlobalTransitions(spec, environmentTransitions, request_id))
+
+workerSpec = None
+
+# Generation workers get their own update log, so a lock held by another thread
+# of the parent at fork time cannot block them; their updates are not reported.
+# Their counters are sent back with each shard.
+def initGenerationWorker(spec, request_id):
+    global workerSpec, update_log, job_metrics
+    workerSpec = spec
+    update_log = UpdateLog(UPDATE_LOG_MAX_ENTRIES, FINISHED_JOB_TTL)
+    update_log.open(request_id, "warning")
+    job_metrics = {}
+
+def generateShard(environmentTransitions, request_id):
+    metrics = job_metrics[request_id] = JobMetrics()
+    results = [generateGlobalTransitions(workerSpec, [environmentTransition], request_id)
+               for environmentTransition in environmentTransitions]
+    return results, metrics.counters
+
+# Yields (environmentTransition, its global transitions) in input order, with the
+# environment transitions generated in contiguous shards on a process pool. The
+# pool gets as many of the requested workers as process_budget has free.
+def parallelGlobalTransitions(spec, environmentTransitions, request_id, workers):
+    with process_budget.reserve(workers) as workers:
+        yield from generateInProcessPool(spec, environmentTransitions, request_id, workers)
+
+def generateInProcessPool(spec, environmentTransitions, request_id, workers):
+    add_update(request_id, "info", f"Generating global transitions on {workers} processes...")
+    size = -(-len(environmentTransitions) // (workers * 4))
+    shards = [environmentTransitions[i:i + size] for i in range(0, len(environmentTransitions), size)]
+    done = 0
+    with ProcessPoolExecutor(workers, initializer=initGenerationWorker, initargs=(spec, request_id)) as executor:
+        for shard, (results, counters) in zip(shards, executor.map(generateShard, shards, itertools.repeat(request_id))):
+            if request_id in job_metrics:
+                job_metrics[request_id].merge_counters(counters)
+            for environmentTransition, globalTransitions in zip(shard, results):
+                done += 1
+                add_update(request_id, "info", f"Processed environment transition {done}/{len(environmentTransitions)}")
+                yield environmentTransition, globalTransitions
+
+# Same transitions in the same order as iterGlobalTransitions, so the tN
+# numbering and the GAL file do not depend on the number of workers.
+def iterGlobalTransitionsParallel(spec, environmentTransitions, request_id, workers):
+    if workers <= 1 or len(environmentTransitions) <= 1:
+        yield from iterGlobalTransitions(spec, environmentTransitions, request_id)
+        return
+    total = 0
+    for _, globalTransitions in parallelGlobalTransitions(spec, environmentTransitions, request_id, workers):
+        total += len(globalTransitions)
+        yield from globalTransitions
+    add_update(request_id, "info", f"Total global transitions generated: {total}")
 
 def initializeGalVariables(agentStates, environmentStates, environmentInitialState, request_id):
     add_update(request_id, "info", "Initializing GAL variables...")
@@ -178,15 +263,27 @@ def initializeGalVariables(agentStates, environmentStates, environmentInitialSta
     add_update(request_id, "info", f"GAL variables initialized: {galVariables}")
     return galVariables
 
-def globalToGalTransitions(globalTransitions, agentStates, agentInitialState, agentLeaveState, request_id):
+# Yields (name, (condition, actions)) GAL transitions as the global transitions
+# arrive, appending the unsafe markings found on the way to unsafeMarkings.
+# Global transitions that only differ in the order of their agents have the same
+# state multisets, so they are merged into one GAL transition, and each unsafe
+# marking is kept once. The counts go to summary.
+def iterGalTransitions(globalTransitions, spec, unsafeMarkings, request_id, summary=None):
     add_update(request_id, "info", "Converting global transitions to GAL transitions...")
-    galTransitions = {}
-    galTransitions["initialTrans"] = ("count < 50", f"{agentInitialState} += 1; count += 1;")
-    galTransitions["leaveTrans"] = (f"{agentLeaveState} > 0", f"{agentLeaveState} -= 1; count -= 1;")
+    debug = update_log.enabled(request_id, "debug")
+    names = spec.names.names
+    agentInitialState = names[spec.agent_initial]
+    agentLeaveState = names[spec.agent_leave]
+    seenTransitions = set()
+    seenMarkings = set()
+    total = 0
+    duplicateMarkings = 0
+    yield "initialTrans", (f"count < {AGENT_BOUND}", f"{agentInitialState} += 1; count += 1;")
+    yield "leaveTrans", (f"{agentLeaveState} > 0", f"{agentLeaveState} -= 1; count -= 1;")
 
     i = 1
-    unsafeMarkings = []
     for globalTransition in globalTransitions:
+        total += 1
         initialStateWeight = {globalTransition[2]: 1}
         for state in globalTransition[0]:
             initialStateWeight[state] = initialStateWeight.get(state, 0) + 1
@@ -195,54 +292,141 @@ def globalToGalTransitions(globalTransitions, agentStates, agentInitialState, ag
         finalStateWeight = {globalTransition[6]: 1}
         for state in globalTransition[5]:
             finalStateWeight[state] = finalStateWeight.get(state, 0) + 1
-            if not flag and agentStates[state] == 0:
+            if not flag and spec.safety[state] == 0:
                 flag = 1
+
+        canonical = (frozenset(initialStateWeight.items()), frozenset(finalStateWeight.items()))
+        if canonical in seenTransitions:
+            continue
+        seenTransitions.add(canonical)
+
         if flag:
-            unsafeMarkings.append(initialStateWeight)
-            add_update(request_id, "warning", f"Found unsafe marking: {initialStateWeight}")
+            if canonical[0] in seenMarkings:
+                duplicateMarkings += 1
+            else:
+                seenMarkings.add(canonical[0])
+                unsafeMarking = {names[state]: weight for state, weight in initialStateWeight.items()}
+                unsafeMarkings.append(unsafeMarking)
+                add_update(request_id, "warning", f"Found unsafe marking: {unsafeMarking}")
 
-        transitionConditions = [f"{state} >= {weight}" for state, weight in initialStateWeight.items()]
+        transitionConditions = [f"{names[state]} >= {weight}" for state, weight in initialStateWeight.items()]
         galTransitionCondition = " && ".join(transitionConditions)
 
-        actions1 = [f"{state} -= {weight};" for state, weight in initialStateWeight.items()]
-        actions2 = [f"{state} += {weight};" for state, weight in finalStateWeight.items()]
+        actions1 = [f"{names[state]} -= {weight};" for state, weight in initialStateWeight.items()]
+        actions2 = [f"{names[state]} += {weight};" for state, weight in finalStateWeight.items()]
         galActions = " ".join(actions1 + actions2)
 
-        galTransitions[f"t{i}"] = (galTransitionCondition, galActions)
-        add_update(request_id, "info", f"GAL transition t{i}: [{galTransitionCondition}] {galActions}")
+        yield f"t{i}", (galTransitionCondition, galActions)
+        if debug:
+            add_update(request_id, "debug", f"GAL transition t{i}: [{galTransitionCondition}] {galActions}")
         i += 1
 
-    add_update(request_id, "info", f"Total GAL transitions: {i-1}")
-    add_update(request_id, "info", f"Total unsafe markings: {len(unsafeMarkings)}")
+    duplicateTransitions = total - (i - 1)
+    add_update(request_id, "info", f"Total GAL transitions: {i-1} ({duplicateTransitions} duplicate global transitions merged)")
+    add_update(request_id, "info", f"Total unsafe markings: {len(unsafeMarkings)} ({duplicateMarkings} duplicates removed)")
+    if summary is not None:
+        summary["globalTransitions"] = total
+        summary["duplicateTransitions"] = duplicateTransitions
+        summary["duplicateUnsafeMarkings"] = duplicateMarkings
+
+def globalToGalTransitions(globalTransitions, spec, request_id, summary=None):
+    unsafeMarkings = []
+    galTransitions = dict(iterGalTransitions(globalTransitions, spec, unsafeMarkings, request_id, summary))
     return galTransitions, unsafeMarkings
 
-def generateGalCode(function_name, variables, transitions, request_id):
+# transitions is a dict or an iterable of (name, (condition, actions)) pairs; it
+# is written out as it is consumed. Returns the file name and transition count.
+def generateGalCode(function_name, variables, transitions, request_id, workdir="."):
     add_update(request_id, "info", f"Generating GAL code for {function_name}...")
-    gal_code = f"gal {function_name} {{\n"
-    for var, value in variables.items():
-        gal_code += f"    int {var} = {value};\n"
-    for transition_name, (condition, actions) in transitions.items():
-        gal_code += f"\n    transition {transition_name} [{condition}] {{\n"
-        gal_code += f"        {actions}\n"
-        gal_code += "    }\n"
-    gal_code += "}\n"
-    file_name = f"{function_name}.gal"
-    with open(file_name, 'w') as file:
-        file.write(gal_code)
+    if isinstance(transitions, dict):
+        transitions = transitions.items()
+    file_name = os.path.join(workdir, f"{function_name}.gal")
+    count = 0
+    with open(file_name, 'w', buffering=GAL_WRITE_BUFFER) as file:
+        file.write(f"gal {function_name} {{\n")
+        for var, value in variables.items():
+            file.write(f"    int {var} = {value};\n")
+        for transition_name, (condition, actions) in transitions:
+            file.write(f"\n    transition {transition_name} [{condition}] {{\n        {actions}\n    }}\n")
+            count += 1
+        file.write("}\n")
     add_update(request_id, "success", f"GAL code written to {file_name}")
-    return file_name
+    return file_name, count
 
-def check_system_safety(unsafeMarkings, request_id):
-    add_update(request_id, "info", "==== CHECKING SYSTEM SAFETY ====")
-    all_states = []
-    with open("testing.gal", "r") as f:
-        for line in f:
-            if line.strip().startswith("int "):
-                state_name = line.strip().split()[1].split("=")[0].strip()
-                if state_name != "count":
-                    all_states.append(state_name)
-    add_update(request_id, "info", f"States in GAL file: {all_states}")
+def logMarkingCheck(request_id, i, checks):
+    marking, state_values, formula = checks[i]
+    add_update(request_id, "info", f"Checking marking {i+1}/{len(checks)}: {marking}")
+    add_update(request_id, "info", f"Mapped to GAL states: {state_values}")
+    add_update(request_id, "info", f"Formula: \"{formula}\"")
+
+def reportMarkingVerdict(request_id, i, verdict):
+    if verdict:
+        add_update(request_id, "warning", f"🚨 Unsafe Marking {i+1} is REACHABLE!")
+    elif verdict is not None:
+        add_update(request_id, "success", f"✅ Unsafe Marking {i+1} is UNREACHABLE.")
+
+# Wall time of one its-reach subprocess, keyed by the marking it checked unless
+# it checked all of them at once.
+def observeItsReach(request_id, seconds, marking=None):
+    metrics = job_metrics.get(request_id)
+    if metrics is not None:
+        metrics.count("itsReachCalls")
+        metrics.observe("itsReachSeconds", seconds, marking)
+
+def checkMarkingsWithIts(checks, pending, request_id, gal_file, concurrency=1, timeout=None, stop_on_first=False):
+    dispatcher = ItsReachDispatcher(gal_file, concurrency, timeout, stop_on_first, process_budget)
+    started = {}
 
+    def on_start(j, cmd):
+        started[j] = time.perf_counter()
+        logMarkingCheck(request_id, pending[j], checks)
+        add_update(request_id, "info", f"Executing: {' '.join(cmd)}")
+
+    def on_result(j, status, verdict, output):
+        i = pending[j]
+        if j in started:
+            observeItsReach(request_id, time.perf_counter() - started[j], i)
+        if status == "error":
+            add_update(request_id, "error", f"Error executing command: {output}")
+        elif status == "timeout":
+            add_update(request_id, "warning", f"its-reach timed out after {timeout}s on marking {i+1}")
+        elif status == "cancelled":
+            add_update(request_id, "info", f"Check of marking {i+1} cancelled, system already known to be unsafe")
+        else:
+            for line in output.split('\n'):
+                if any(term in line for term in ["property", "true", "false", "reachable states"]):
+                    add_update(request_id, "info", line)
+        reportMarkingVerdict(request_id, i, verdict)
+
+    statuses, verdicts = dispatcher.run([checks[i][2] for i in pending], on_start, on_result)
+    return verdicts
+
+def checkMarkingsWithItsBatch(formulas, request_id, gal_file):
+    try:
+        property_file = write_property_gal(gal_file, formulas)
+        cmd = reach_command(property_file)
+        add_update(request_id, "info", f"Executing: {' '.join(cmd)}")
+        with process_budget.reserve():
+            start = time.perf_counter()
+            output = run_its_reach(property_file)
+            observeItsReach(request_id, time.perf_counter() - start)
+
+        for line in output.split('\n'):
+            if "reachable states" in line:
+                add_update(request_id, "info", line)
+
+        verdicts = parse_property_verdicts(output, len(formulas))
+        missing = verdicts.count(None)
+        if missing:
+            add_update(request_id, "warning", f"No batch verdict for {missing} markings, checking them one by one")
+        return verdicts
+    except Exception as e:
+        add_update(request_id, "error", f"Error executing command: {e}")
+        return [None] * len(formulas)
+
+# (marking, GAL state values, its-reach formula) for every unsafe marking, over
+# the GAL states in all_states.
+def markingChecks(unsafeMarkings, all_states, request_id):
     state_mapping = {}
     for marking in unsafeMarkings:
         for state in marking.keys():
@@ -257,8 +441,8 @@ def check_system_safety(unsafeMarkings, request_id):
                     add_update(request_id, "warning", f"Could not map state {state} to any GAL state")
     add_update(request_id, "info", f"State mapping: {state_mapping}")
 
-    system_unsafe = False
-    for i, marking in enumerate(unsafeMarkings):
+    checks = []
+    for marking in unsafeMarkings:
         state_values = {state: 0 for state in all_states}
         for state, count in marking.items():
             if state in state_mapping:
@@ -267,64 +451,357 @@ def check_system_safety(unsafeMarkings, request_id):
 
         formula_parts = [f"{state}=={value}" for state, value in state_values.items()]
         formula = " && ".join(formula_parts)
-        add_update(request_id, "info", f"Checking marking {i+1}/{len(unsafeMarkings)}: {marking}")
-        add_update(request_id, "info", f"Mapped to GAL states: {state_values}")
-        add_update(request_id, "info", f"Formula: \"{formula}\"")
+        checks.append((marking, state_values, formula))
+    return checks
 
-        try:
-            cmd = ["./its-reach", "-i", "testing.gal", "-t", "GAL", "-reachable", formula]
-            add_update(request_id, "info", f"Executing: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            output = result.stdout
-            
-            for line in output.split('\n'):
-                if any(term in line for term in ["property", "true", "false", "reachable states"]):
-                    add_update(request_id, "info", line)
-            
-            if "is true" in output:
-                add_update(request_id, "warning", f"🚨 Unsafe Marking {i+1} is REACHABLE!")
-                system_unsafe = True
-            else:
-                add_update(request_id, "success", f"✅ Unsafe Marking {i+1} is UNREACHABLE.")
-        except Exception as e:
-            add_update(request_id, "error", f"Error executing command: {e}")
+# Passes streamed GAL transitions on unchanged, adding each to the state equation.
+def collectStateEquation(galTransitions, stateEquation):
+    for name, (condition, actions) in galTransitions:
+        stateEquation.add(*stateEquation.net.compile_transition(condition, actions))
+        yield name, (condition, actions)
+
+# State equation of a GAL file written by generateGalCode, read a line at a time.
+def readStateEquation(gal_file):
+    variables = {}
+    stateEquation = None
+    condition = None
+    with open(gal_file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("int "):
+                var, value = line[4:].rstrip(";").split("=")
+                variables[var.strip()] = int(value)
+            elif line.startswith("transition"):
+                condition = line.split("[")[1].split("]")[0]
+            elif condition is not None and ";" in line:
+                if stateEquation is None:
+                    stateEquation = StateEquation(CompiledNet(variables, {}))
+                stateEquation.add(*stateEquation.net.compile_transition(condition, line))
+                condition = None
+    return stateEquation or StateEquation(CompiledNet(variables, {}))
+
+# Marks the unsafe markings that place bounds, place invariants or the state
+# equation already rule out as UNREACHABLE (StateEquation.proves_unreachable),
+# so only the others reach the explorer or its-reach. Without a state equation
+# collected while the transitions streamed into the GAL file, it comes from the
+# compiled net, the GAL transitions or the GAL file.
+def prefilterMarkings(checks, verdicts, request_id, net, galVariables, galTransitions, gal_file, stateEquation=None):
+    if stateEquation is None:
+        if net is not None:
+            stateEquation = StateEquation.from_net(net)
+        elif galTransitions is not None:
+            stateEquation = StateEquation.from_net(CompiledNet(galVariables, galTransitions))
+        else:
+            stateEquation = readStateEquation(gal_file)
+    ruled_out = 0
+    for i, (_, state_values, _) in enumerate(checks):
+        if verdicts[i] is None and stateEquation.proves_unreachable(state_values):
+            verdicts[i] = False
+            ruled_out += 1
+            add_update(request_id, "debug", f"Unsafe marking {i+1} violates a place invariant or the state equation")
+            reportMarkingVerdict(request_id, i, False)
+    countMetric(request_id, "prefilteredMarkings", ruled_out)
+    add_update(request_id, "info", f"Ruled out {ruled_out}/{len(checks)} unsafe markings without a reachability check")
+
+def check_system_safety(unsafeMarkings, request_id, engine="its", galVariables=None, galTransitions=None, multi_target=False,
+                        concurrency=1, timeout=None, stop_on_first=False, gal_file="testing.gal",
+                        known_verdicts=None, reduction=False, report=True, state_equation=None):
+    add_update(request_id, "info", "==== CHECKING SYSTEM SAFETY ====")
+    all_states = []
+    if engine == "native":
+        all_states = [state for state in galVariables if state != "count"]
+        explorer = ReachabilityExplorer.from_gal_transitions(galVariables, galTransitions, reduction,
+                                                             VISITED_HOT_STATES, VISITED_SPILL_DIR)
+        add_update(request_id, "info", "Using native reachability engine" +
+                   (" with partial-order reduction" if reduction else ""))
+    else:
+        with open(gal_file, "r") as f:
+            for line in f:
+                if line.strip().startswith("int "):
+                    state_name = line.strip().split()[1].split("=")[0].strip()
+                    if state_name != "count":
+                        all_states.append(state_name)
+    add_update(request_id, "info", f"States in GAL file: {all_states}")
+
+    checks = markingChecks(unsafeMarkings, all_states, request_id)
+
+    verdicts = [None] * len(checks)
+    if known_verdicts:
+        for i, (_, _, formula) in enumerate(checks):
+            verdicts[i] = known_verdicts.get(formula)
+        reused = len(checks) - verdicts.count(None)
+        if reused:
+            add_update(request_id, "info", f"Reusing {reused} verdicts from the previous run")
+            for i, verdict in enumerate(verdicts):
+                reportMarkingVerdict(request_id, i, verdict)
+
+    if None in verdicts:
+        with stageMetric(request_id, "prefilter"):
+            prefilterMarkings(checks, verdicts, request_id, explorer.net if engine == "native" else None,
+                              galVariables, galTransitions, gal_file, state_equation)
+
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if stop_on_first and any(verdicts):
+        pending = []
 
+    if multi_target and pending:
+        add_update(request_id, "info", f"Checking all {len(pending)} unsafe markings in a single pass")
+        for i in pending:
+            logMarkingCheck(request_id, i, checks)
+        if engine == "native":
+            found = explorer.search([checks[i][1] for i in pending], stop_on_first=stop_on_first)
+            batch_verdicts = [True if j in found else (False if explorer.exhausted else None) for j in range(len(pending))]
+            add_update(request_id, "info", f"Explored {explorer.explored_states} states")
+            countMetric(request_id, "exploredStates", explorer.explored_states)
+            countMetric(request_id, "spilledStates", explorer.spilled_states)
+        else:
+            batch_verdicts = checkMarkingsWithItsBatch([checks[i][2] for i in pending], request_id, gal_file)
+        for i, verdict in zip(pending, batch_verdicts):
+            verdicts[i] = verdict
+            reportMarkingVerdict(request_id, i, verdict)
+
+        pending = [i for i in pending if verdicts[i] is None]
+        if stop_on_first and any(verdicts):
+            pending = []
+
+    if engine == "native":
+        for i in pending:
+            logMarkingCheck(request_id, i, checks)
+            verdicts[i] = explorer.is_reachable(checks[i][1])
+            add_update(request_id, "info", f"Explored {explorer.explored_states} states")
+            countMetric(request_id, "exploredStates", explorer.explored_states)
+            countMetric(request_id, "spilledStates", explorer.spilled_states)
+            reportMarkingVerdict(request_id, i, verdicts[i])
+            if stop_on_first and verdicts[i]:
+                break
+    elif pending:
+        pending_verdicts = checkMarkingsWithIts(checks, pending, request_id, gal_file,
+                                                concurrency, timeout, stop_on_first)
+        for i, verdict in zip(pending, pending_verdicts):
+            verdicts[i] = verdict
+
+    if known_verdicts is not None:
+        for (_, _, formula), verdict in zip(checks, verdicts):
+            if verdict is not None:
+                known_verdicts[formula] = verdict
+
+    system_unsafe = any(verdicts)
+    if report:
+        reportSafety(request_id, system_unsafe, verdicts.count(None))
+    return system_unsafe, verdicts
+
+def reportSafety(request_id, system_unsafe, unchecked):
     add_update(request_id, "info", "==== SAFETY ANALYSIS COMPLETE ====")
     if system_unsafe:
         add_update(request_id, "error", "❌ SYSTEM IS UNSAFE: At least one unsafe marking is reachable.")
+    elif unchecked:
+        add_update(request_id, "warning", f"⚠️ SAFETY INCONCLUSIVE: {unchecked} unsafe markings could not be checked.")
     else:
         add_update(request_id, "success", "✅ SYSTEM IS SAFE: No unsafe markings are reachable.")
-    return system_unsafe
 
-def process_input(input_text, request_id):
+# Agent bounds 1, 2, 4, ... below max_bound, then max_bound itself.
+def deepeningBounds(max_bound):
+    bounds = []
+    bound = 1
+    while bound < max_bound:
+        bounds.append(bound)
+        bound *= 2
+    bounds.append(max_bound)
+    return bounds
+
+# Copy of the GAL file whose initialTrans admits at most `bound` agents.
+def boundedGalFile(gal_file, bound):
+    bounded_file = os.path.splitext(gal_file)[0] + f"_bound{bound}.gal"
+    with open(gal_file, "r") as f:
+        gal_code = f.read()
+    with open(bounded_file, "w") as f:
+        f.write(gal_code.replace(f"[count < {AGENT_BOUND}]", f"[count < {bound}]", 1))
+    return bounded_file
+
+# Checks the unsafe markings under agent bounds 1, 2, 4, ... up to max_bound and
+# stops at the first bound under which one of them is reachable. The native engine
+# keeps the markings explored under the previous bounds and only expands the ones
+# a bound held back; the its engine checks a bounded copy of the GAL file per bound.
+# Markings not reached when it stops below max_bound get no verdict. The safety
+# verdict is reported once, after the last bound. Returns (unsafe, verdicts, last
+# bound checked).
+def check_system_safety_deepening(unsafeMarkings, request_id, engine="its", galVariables=None, galTransitions=None,
+                                  max_bound=AGENT_BOUND, multi_target=False, concurrency=1, timeout=None,
+                                  stop_on_first=False, gal_file="testing.gal", reduction=False):
+    bounds = deepeningBounds(max_bound)
+    add_update(request_id, "info", f"==== CHECKING SYSTEM SAFETY UNDER AGENT BOUNDS {bounds} ====")
+    if not unsafeMarkings:
+        reportSafety(request_id, False, 0)
+        return False, [], max_bound
+    if engine == "native":
+        all_states = [state for state in galVariables if state != "count"]
+        checks = markingChecks(unsafeMarkings, all_states, request_id)
+        explorer = ReachabilityExplorer.from_gal_transitions(galVariables, galTransitions, reduction,
+                                                             VISITED_HOT_STATES, VISITED_SPILL_DIR)
+        # Markings the prefilter rules out are unreachable under every bound.
+        verdicts = [None] * len(checks)
+        with stageMetric(request_id, "prefilter"):
+            prefilterMarkings(checks, verdicts, request_id, explorer.net, galVariables, galTransitions, gal_file)
+        pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        bound, found = max_bound, set()
+        if pending:
+            for bound, found in explorer.deepen([checks[i][1] for i in pending], bounds, stop_on_first=stop_on_first):
+                countMetric(request_id, "deepeningRounds")
+                add_update(request_id, "info", f"Agent bound {bound}: {explorer.explored_states} states explored, "
+                                               f"{len(found)} unsafe markings reachable")
+            countMetric(request_id, "exploredStates", explorer.explored_states)
+            countMetric(request_id, "spilledStates", explorer.spilled_states)
+        decided = bound == max_bound and (not pending or explorer.exhausted)
+        for j, i in enumerate(pending):
+            verdicts[i] = True if j in found else (False if decided else None)
+            reportMarkingVerdict(request_id, i, verdicts[i])
+        system_unsafe = bool(found)
+        reportSafety(request_id, system_unsafe, verdicts.count(None))
+        return system_unsafe, verdicts, bound
+
+    for bound in bounds:
+        countMetric(request_id, "deepeningRounds")
+        add_update(request_id, "info", f"==== AGENT BOUND {bound} ====")
+        system_unsafe, verdicts = check_system_safety(unsafeMarkings, request_id, engine, multi_target=multi_target,
+                                                      concurrency=concurrency, timeout=timeout, stop_on_first=stop_on_first,
+                                                      gal_file=boundedGalFile(gal_file, bound), report=False)
+        if system_unsafe or None in verdicts:
+            break
+        add_update(request_id, "info", f"No unsafe marking is reachable with up to {bound} agents")
+    if bound < max_bound:
+        verdicts = [verdict or None for verdict in verdicts]
+    reportSafety(request_id, system_unsafe, verdicts.count(None))
+    return system_unsafe, verdicts, bound
+
+def process_input(input_text, request_id, engine="its", multi_target=False, concurrency=1, timeout=None, stop_on_first=False,
+                  session_id=None, generation_workers=1, max_agent_bound=None, reduction=False, workdir="."):
+    if session_id:
+        session = verification_sessions.get(session_id)
+        with session.lock:
+            runPipeline(input_text, request_id, engine, multi_target, concurrency, timeout, stop_on_first, workdir, session,
+                        generation_workers, max_agent_bound, reduction)
+    else:
+        runPipeline(input_text, request_id, engine, multi_target, concurrency, timeout, stop_on_first, workdir,
+                    generation_workers=generation_workers, max_agent_bound=max_agent_bound, reduction=reduction)
+
+# Results checked under a smaller agent bound than the GAL net's are cached apart.
+def resultCacheKey(input_text, engine, max_agent_bound=None):
+    options = [engine] if max_agent_bound in (None, AGENT_BOUND) else [engine, max_agent_bound]
+    return cache_key("its", input_text, options)
+
+# The session's Interner is shared by all its parses, so the IDs in reused
+# global transitions keep their meaning.
+def generateGlobalTransitionsIncremental(session, spec, agentTransitions, request_id, workers=1):
+    environmentTransitions = spec.environment_transitions
+    reusable = session.reusable_global_transitions(agentTransitions, [t.key for t in environmentTransitions])
+    add_update(request_id, "info", f"Reusing global transitions of {len(reusable)}/{len(environmentTransitions)} environment transitions")
+    globalTransitionsByEnvironment = dict(reusable)
+    missing = list({t.key: t for t in environmentTransitions if t.key not in reusable}.values())
+    if workers > 1 and len(missing) > 1:
+        for environmentTransition, generated in parallelGlobalTransitions(spec, missing, request_id, workers):
+            globalTransitionsByEnvironment[environmentTransition.key] = generated
+    else:
+        for environmentTransition in missing:
+            globalTransitionsByEnvironment[environmentTransition.key] = generateGlobalTransitions(spec, [environmentTransition], request_id)
+    globalTransitions = []
+    for environmentTransition in environmentTransitions:
+        globalTransitions.extend(globalTransitionsByEnvironment[environmentTransition.key])
+    return globalTransitions, globalTransitionsByEnvironment
+
+# With max_agent_bound, safety is checked by bound deepening up to that bound.
+# reduction enables partial-order reduction in the native engine.
+def runPipeline(input_text, request_id, engine, multi_target, concurrency, timeout, stop_on_first, workdir, session=None,
+                generation_workers=1, max_agent_bound=None, reduction=False):
+    metrics = job_metrics[request_id] = JobMetrics()
     try:
-        add_update(request_id, "info", "Starting input processing...")
-        
-        result = readInput(input_text, request_id)
-        agentStates, agentActions, agentProtocols, agentTransitions, agentInitialState, agentLeaveState, environmentStates, environmentActions, environmentProtocols, environmentInitialState, environmentTransitions = result
-        
-        galVariables = initializeGalVariables(agentStates, environmentStates, environmentInitialState, request_id)
-        
-        globalTransitions = generateGlobalTransitions(agentTransitions, environmentTransitions, request_id)
-        
-        galTransitions, unsafeMarkings = globalToGalTransitions(globalTransitions, agentStates, agentInitialState, agentLeaveState, request_id)
-        
-        generateGalCode("testing", galVariables, galTransitions, request_id)
+        with metrics.stage("total"):
+            add_update(request_id, "info", "Starting input processing...")
+            
+            with metrics.stage("parse"):
+                spec = readInput(input_text, request_id, session.names if session is not None else None)
+            
+            galVariables = initializeGalVariables(spec.agent_states, spec.environment_states,
+                                                  spec.names.names[spec.environment_initial], request_id)
+            
+            if session is not None:
+                agentTransitions = spec.agent_transitions_by_key()
+                with metrics.stage("globalTransitions"):
+                    globalTransitions, globalTransitionsByEnvironment = generateGlobalTransitionsIncremental(
+                        session, spec, agentTransitions, request_id, generation_workers)
+            else:
+                globalTransitions = metrics.timed("globalTransitions", iterGlobalTransitionsParallel(
+                    spec, spec.environment_transitions, request_id, generation_workers))
+            
+            # The its engine only needs the GAL file, so the transitions are streamed
+            # straight into it; the native engine and sessions keep them in memory.
+            # Streamed stages interleave, so each is timed without the stages it pulls from.
+            # The pre-filter's state equation is collected on the way, keeping only
+            # the distinct transition effects.
+            summary = {}
+            stateEquation = None
+            if engine == "its" and session is None:
+                galTransitions = None
+                unsafeMarkings = []
+                stateEquation = StateEquation(CompiledNet(galVariables, {}))
+                galTransitionIterator = metrics.timed("galTransitions", collectStateEquation(iterGalTransitions(
+                    globalTransitions, spec, unsafeMarkings, request_id, summary), stateEquation),
+                    exclude=("globalTransitions",))
+                with metrics.stage("galCode", exclude=("globalTransitions", "galTransitions")):
+                    gal_file, galTransitionCount = generateGalCode("testing", galVariables, galTransitionIterator,
+                                                                   request_id, workdir)
+            else:
+                with metrics.stage("galTransitions", exclude=("globalTransitions",)):
+                    galTransitions, unsafeMarkings = globalToGalTransitions(globalTransitions, spec, request_id, summary)
+                with metrics.stage("galCode"):
+                    gal_file, galTransitionCount = generateGalCode("testing", galVariables, galTransitions, request_id, workdir)
+            metrics.count("globalTransitions", summary["globalTransitions"])
+            metrics.count("galTransitions", galTransitionCount)
+            metrics.count("unsafeMarkings", len(unsafeMarkings))
+            
+            known_verdicts = session.reusable_verdicts(galVariables, galTransitions) if session is not None else None
+            with metrics.stage("safetyCheck"):
+                if max_agent_bound is not None:
+                    # Verdicts under a bound say nothing about the session's other runs.
+                    known_verdicts = {}
+                    is_unsafe, markingVerdicts, agentBound = check_system_safety_deepening(
+                        unsafeMarkings, request_id, engine, galVariables, galTransitions, max_agent_bound, multi_target,
+                        concurrency, timeout, stop_on_first, gal_file, reduction)
+                else:
+                    agentBound = AGENT_BOUND
+                    is_unsafe, markingVerdicts = check_system_safety(unsafeMarkings, request_id, engine, galVariables,
+                                                                     galTransitions, multi_target, concurrency, timeout,
+                                                                     stop_on_first, gal_file, known_verdicts, reduction,
+                                                                     state_equation=stateEquation)
+            if session is not None:
+                session.update(agentTransitions, globalTransitionsByEnvironment, galVariables, galTransitions, known_verdicts)
+            
+            result = {
+                "completed": True,
+                "unsafe": is_unsafe,
+                "unsafeMarkings": unsafeMarkings,
+                "markingVerdicts": markingVerdicts,
+                "agentStates": spec.agent_states,
+                "agentActions": spec.agent_actions,
+                "agentProtocols": spec.agent_protocols,
+                "environmentStates": spec.environment_states,
+                "environmentActions": spec.environment_actions,
+                "environmentProtocols": spec.environment_protocols,
+                "globalTransitions": summary["globalTransitions"],
+                "galTransitions": galTransitionCount,
+                "duplicateTransitions": summary["duplicateTransitions"],
+                "duplicateUnsafeMarkings": summary["duplicateUnsafeMarkings"],
+                "agentBound": agentBound,
+                "engine": engine
+            }
+            
+            # Only results with a definite verdict for every marking are cached, before
+            # the timings are added, since those describe this run only.
+            if None not in markingVerdicts:
+                pipeline_cache.put(resultCacheKey(input_text, engine, max_agent_bound), {"result": result})
         
-        is_unsafe = check_system_safety(unsafeMarkings, request_id)
-        
-        processing_results[request_id] = {
-            "completed": True,
-            "unsafe": is_unsafe,
-            "unsafeMarkings": unsafeMarkings,
-            "agentStates": agentStates,
-            "agentActions": agentActions,
-            "agentProtocols": agentProtocols,
-            "environmentStates": environmentStates,
-            "environmentActions": environmentActions,
-            "environmentProtocols": environmentProtocols,
-            "globalTransitions": len(globalTransitions)
-        }
+        result["timings"] = metrics.to_dict()
+        processing_results[request_id] = result
+        metrics_registry.record(metrics)
         
         add_update(request_id, "success", "Processing completed successfully!")
         
@@ -332,8 +809,20 @@ def process_input(input_text, request_id):
         add_update(request_id, "error", f"Error during processing: {str(e)}")
         processing_results[request_id] = {
             "completed": False,
-            "error": str(e)
+            "error": str(e),
+            "timings": metrics.to_dict()
         }
+        metrics_registry.record(metrics, "failed")
+    finally:
+        job_metrics.pop(request_id, None)
+
+def run_job(input_text, request_id, *options):
+    add_update(request_id, "info", "Job started")
+    try:
+        with job_workspace(request_id) as workdir:
+            process_input(input_text, request_id, *options, workdir=workdir)
+    finally:
+        update_log.finish(request_id)
 
 @app.route('/process', methods=['POST'])
 @cross_origin()
@@ -343,14 +832,50 @@ def process_file():
         if not data:
             return jsonify({"error": "No JSON received"}), 400
         input_text = data.get("input_text", "")
+        engine = data.get("engine", "its")
+        multi_target = bool(data.get("multi_target", False))
+        concurrency = min(int(data.get("concurrency", 1)), MAX_ITS_CONCURRENCY)
+        timeout = float(data["timeout"]) if data.get("timeout") else None
+        stop_on_first = bool(data.get("stop_on_first", False))
+        session_id = data.get("session_id")
+        generation_workers = min(int(data.get("generation_workers", GENERATION_WORKERS)), os.cpu_count() or 1)
+        if engine not in SAFETY_ENGINES:
+            return jsonify({"error": f"Unknown engine '{engine}', expected one of {list(SAFETY_ENGINES)}"}), 400
+        max_agent_bound = None
+        if data.get("bound_deepening"):
+            max_agent_bound = int(data.get("max_agent_bound", AGENT_BOUND))
+            if not 1 <= max_agent_bound <= AGENT_BOUND:
+                return jsonify({"error": f"max_agent_bound must be between 1 and {AGENT_BOUND}"}), 400
+        reduction = bool(data.get("partial_order_reduction", False))
         
-        request_id = str(time.time())
+        priority = int(data.get("priority", 0))
+        use_cache = bool(data.get("use_cache", True))
+        log_level = data.get("log_level", "info")
+        if log_level not in LOG_LEVELS:
+            return jsonify({"error": f"Unknown log_level '{log_level}', expected one of {list(LOG_LEVELS)}"}), 400
         
-        processing_updates[request_id] = []
+        request_id = f"{time.time()}-{uuid.uuid4().hex[:8]}"
+        
+        update_log.open(request_id, log_level)
         processing_results[request_id] = {"completed": False}
         
-        thread = threading.Thread(target=process_input, args=(input_text, request_id))
-        thread.start()
+        cached = pipeline_cache.get(resultCacheKey(input_text, engine, max_agent_bound)) if use_cache else None
+        if cached:
+            processing_results[request_id] = dict(cached["result"], cached=True)
+            metrics_registry.record(JobMetrics(), "cached")
+            add_update(request_id, "success", "Result loaded from cache, input was processed before.")
+            update_log.finish(request_id)
+            return jsonify({"message": "Processing completed", "request_id": request_id, "cached": True})
+        
+        add_update(request_id, "info", "Job queued")
+        
+        try:
+            scheduler.submit(run_job, (input_text, request_id, engine, multi_target, concurrency, timeout,
+                                       stop_on_first, session_id, generation_workers, max_agent_bound, reduction), priority)
+        except QueueFull as e:
+            update_log.remove(request_id)
+            del processing_results[request_id]
+            return jsonify({"error": str(e)}), 503
         
         return jsonify({"message": "Processing started", "request_id": request_id})
     except Exception as e:
@@ -359,18 +884,50 @@ def process_file():
 @app.route('/updates/<request_id>', methods=['GET'])
 @cross_origin()
 def get_updates(request_id):
-    if request_id not in processing_updates:
+    if not update_log.has(request_id):
         return jsonify({"error": "Invalid request ID"}), 404
     
-    updates = processing_updates[request_id]
+    since = max(request.args.get("since", 0, type=int), 0)
+    wait = min(request.args.get("wait", 0, type=float), LONG_POLL_MAX_WAIT)
+    if wait > 0:
+        updates, next_cursor = update_log.wait(request_id, since, wait, lambda: isFinished(request_id))
+    else:
+        updates, next_cursor = update_log.read(request_id, since)
     result = processing_results.get(request_id, {"completed": False})
     
     return jsonify({
         "updates": updates,
+        "next": next_cursor,
         "completed": result.get("completed", False),
         "result": result
     })
 
+@app.route('/stream/<request_id>', methods=['GET'])
+@cross_origin()
+def stream_updates(request_id):
+    if not update_log.has(request_id):
+        return jsonify({"error": "Invalid request ID"}), 404
+    
+    last_event_id = request.headers.get("Last-Event-ID")
+    cursor = int(last_event_id) + 1 if last_event_id else max(request.args.get("since", 0, type=int), 0)
+    
+    def generate(cursor):
+        while True:
+            updates, cursor = update_log.wait(request_id, cursor, STREAM_KEEPALIVE, lambda: isFinished(request_id))
+            for i, update in enumerate(updates):
+                # Only the last event of a batch carries an id; a reconnect resumes after it.
+                event_id = f"id: {cursor - 1}\n" if i == len(updates) - 1 else ""
+                yield f"{event_id}data: {json.dumps(update)}\n\n"
+            if not updates:
+                if isFinished(request_id):
+                    result = processing_results.get(request_id, {})
+                    yield f"event: complete\ndata: {json.dumps(result)}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+    
+    return Response(stream_with_context(generate(cursor)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route('/status/<request_id>', methods=['GET'])
 @cross_origin()
 def get_status(request_id):
@@ -389,8 +946,19 @@ def complete_processing(request_id):
     
     processing_results[request_id]["completed"] = True
     add_update(request_id, "success", "Processing marked as completed manually!")
+    update_log.finish(request_id)
     
     return jsonify({"message": "Processing marked as completed"})
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    gauges = {}
+    for prefix, stats in (("scheduler", scheduler.stats()), ("subprocess", process_budget.stats()),
+                          ("cache", pipeline_cache.stats()), ("update_log", update_log.stats()),
+                          ("session", verification_sessions.stats())):
+        for name, value in stats.items():
+            gauges[f"{prefix}_{name}"] = value
+    return Response(metrics_registry.render(gauges), mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=7050, debug=True)
@@ -0,0 +1,101 @@
+import itertools
+import queue
+import shutil
+import tempfile
+import threading
+import traceback
+from contextlib import contextmanager
+
+
+class QueueFull(Exception):
+    pass
+
+
+# Fixed pool of worker threads fed from a bounded priority queue. Higher
+# priority jobs run first, equal priorities run in submission order. When the
+# queue is full, submit() raises QueueFull instead of accepting more work.
+class JobScheduler:
+    def __init__(self, workers, max_queued):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queue = queue.PriorityQueue(maxsize=max_queued)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, args=(), priority=0):
+        try:
+            self._queue.put_nowait((-priority, next(self._sequence), fn, args))
+        except queue.Full:
+            raise QueueFull(f"Job queue is full ({self.max_queued} jobs waiting)")
+
+    def stats(self):
+        with self._lock:
+            running = self._running
+        return {"workers": self.workers, "running": running, "queued": self._queue.qsize(), "max_queued": self.max_queued}
+
+    def _work(self):
+        while True:
+            _, _, fn, args = self._queue.get()
+            with self._lock:
+                self._running += 1
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+
+# Process-wide limit on the child processes jobs start (its-reach runs and global
+# transition generation workers). All jobs share it, so JOB_WORKERS jobs with
+# their own concurrency never run more than `slots` of them at once.
+class ProcessBudget:
+    def __init__(self, slots):
+        self.slots = max(1, slots)
+        self._free = self.slots
+        self._changed = threading.Condition()
+
+    # Waits for one free slot, then takes up to `count` without waiting for more,
+    # so no job holds slots while it waits for others. Returns the number taken.
+    def acquire(self, count=1):
+        with self._changed:
+            while not self._free:
+                self._changed.wait()
+            taken = min(max(1, count), self._free)
+            self._free -= taken
+            return taken
+
+    def release(self, count=1):
+        with self._changed:
+            self._free += count
+            self._changed.notify_all()
+
+    @contextmanager
+    def reserve(self, count=1):
+        taken = self.acquire(count)
+        try:
+            yield taken
+        finally:
+            self.release(taken)
+
+    def stats(self):
+        with self._changed:
+            return {"slots": self.slots, "in_use": self.slots - self._free}
+
+
+# Private scratch directory for one job's GAL files, removed when the job ends.
+@contextmanager
+def job_workspace(request_id):
+    workdir = tempfile.mkdtemp(prefix=f"job-{request_id}-")
+    try:
+        yield workdir
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
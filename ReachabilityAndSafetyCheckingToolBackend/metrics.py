@@ -0,0 +1,142 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Wall and CPU time per pipeline stage plus free-form counters for one job.
+# CPU time is the running thread's, so it excludes subprocesses and worker
+# processes. Stages may overlap: `exclude` names stages whose time accrued
+# meanwhile is subtracted, which keeps nested generators from being counted twice.
+class JobMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.observations = {}
+
+    def _clocks(self, exclude):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        for name in exclude:
+            stage = self.stages.get(name)
+            if stage:
+                wall -= stage["wall"]
+                cpu -= stage["cpu"]
+        return wall, cpu
+
+    def _add(self, name, start, exclude):
+        wall, cpu = self._clocks(exclude)
+        stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+        stage["wall"] += wall - start[0]
+        stage["cpu"] += cpu - start[1]
+
+    @contextmanager
+    def stage(self, name, exclude=()):
+        start = self._clocks(exclude)
+        try:
+            yield
+        finally:
+            self._add(name, start, exclude)
+
+    # Wraps a lazy stage, so only the time spent producing its items counts.
+    def timed(self, name, iterable, exclude=()):
+        iterator = iter(iterable)
+        while True:
+            start = self._clocks(exclude)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._add(name, start, exclude)
+            yield item
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge_counters(self, counters):
+        for name, amount in counters.items():
+            self.count(name, amount)
+
+    # Observations with a key (e.g. the index of a checked marking) are also
+    # reported one by one.
+    def observe(self, name, value, key=None):
+        self.observations.setdefault(name, []).append((key, value))
+
+    def to_dict(self):
+        observations = {}
+        for name, values in self.observations.items():
+            summary = {"count": len(values), "sum": sum(value for _, value in values),
+                       "max": max(value for _, value in values)}
+            byKey = {key: value for key, value in values if key is not None}
+            if byKey:
+                summary["byKey"] = byKey
+            observations[name] = summary
+        return {
+            "stages": {name: dict(stage) for name, stage in self.stages.items()},
+            "counters": dict(self.counters),
+            "observations": observations,
+        }
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Totals over all finished jobs of one app, rendered in the Prometheus text
+# exposition format. Counter and observation names are camelCase in results and
+# snake_case in metric names.
+class MetricsRegistry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._stage_seconds = {}
+        self._stage_runs = {}
+        self._counters = {}
+        self._observations = {}
+
+    def record(self, job_metrics, status="completed"):
+        with self._lock:
+            self._jobs[status] = self._jobs.get(status, 0) + 1
+            for name, stage in job_metrics.stages.items():
+                for clock in ("wall", "cpu"):
+                    key = (name, clock)
+                    self._stage_seconds[key] = self._stage_seconds.get(key, 0.0) + stage[clock]
+                self._stage_runs[name] = self._stage_runs.get(name, 0) + 1
+            for name, amount in job_metrics.counters.items():
+                self._counters[name] = self._counters.get(name, 0) + amount
+            for name, values in job_metrics.observations.items():
+                total, count = self._observations.get(name, (0.0, 0))
+                self._observations[name] = (total + sum(value for _, value in values), count + len(values))
+
+    def render(self, gauges=None):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{self.prefix}_{name}{suffix}{_labels(labels)} {value}")
+
+        with self._lock:
+            metric("jobs_total", "counter", "Finished jobs by status.",
+                   [("", [("status", status)], count) for status, count in sorted(self._jobs.items())])
+            metric("stage_seconds_total", "counter", "Time spent in each pipeline stage.",
+                   [("", [("stage", name), ("clock", clock)], seconds)
+                    for (name, clock), seconds in sorted(self._stage_seconds.items())])
+            metric("stage_runs_total", "counter", "Number of jobs that ran each pipeline stage.",
+                   [("", [("stage", name)], runs) for name, runs in sorted(self._stage_runs.items())])
+            for name, amount in sorted(self._counters.items()):
+                metric(f"{snake_case(name)}_total", "counter", f"Sum of the {name} counter over all jobs.", [("", [], amount)])
+            for name, (total, count) in sorted(self._observations.items()):
+                metric(snake_case(name), "summary", f"Distribution of {name}.",
+                       [("_sum", [], total), ("_count", [], count)])
+        for name, value in sorted((gauges or {}).items()):
+            metric(name, "gauge", f"Current {name.replace('_', ' ')}.", [("", [], value)])
+        return "\n".join(lines) + "\n"
+
+
+def snake_case(name):
+    return "".join("_" + c.lower() if c.isupper() else c for c in name)
@@ -0,0 +1,142 @@
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from simulator import PetriNetSimulator
+
+MAX_WALKS = 100000
+
+_worker_simulator = None
+_worker_targets = None
+
+
+def _build_simulator(gal_code):
+    return PetriNetSimulator(gal_code)
+
+
+# A target matches a marking when every place it names has exactly that value,
+# the same check the frontend applies to final_values. Targets are compiled to
+# (place index, value) pairs; targets naming unknown places can never match and
+# are dropped.
+def compile_targets(net, targets):
+    compiled = []
+    for target in targets or []:
+        if all(place in net.place_index for place in target):
+            compiled.append(tuple((net.place_index[place], int(value)) for place, value in target.items()))
+    return compiled
+
+
+def _matches(marking, targets):
+    for target in targets:
+        if all(marking[idx] == value for idx, value in target):
+            return True
+    return False
+
+
+def _walk_seed(seed, walk):
+    return seed * 1000003 + walk
+
+
+def _empty_statistics(places):
+    return {
+        "walks": 0,
+        "steps": 0,
+        "deadlocks": 0,
+        "unsafe_hits": 0,
+        "occupancy": {place: Counter() for place in places},
+        "first_hit_steps": Counter(),
+    }
+
+
+def _run_walks(simulator, targets, walks, max_steps, seed):
+    places = simulator.net.places
+    statistics = _empty_statistics(places)
+    occupancy = [statistics["occupancy"][place] for place in places]
+
+    for walk in walks:
+        rng = random.Random(_walk_seed(seed, walk))
+        trace = simulator.simulate_compact(max_steps=max_steps, rng=rng)
+
+        first_hit = None
+        for step, marking in enumerate(trace.markings()):
+            for histogram, value in zip(occupancy, marking):
+                histogram[value] += 1
+            if first_hit is None and targets and _matches(marking, targets):
+                first_hit = step
+
+        statistics["walks"] += 1
+        statistics["steps"] += len(trace) - 1
+        if len(trace) - 1 < max_steps:
+            statistics["deadlocks"] += 1
+        if first_hit is not None:
+            statistics["unsafe_hits"] += 1
+            statistics["first_hit_steps"][first_hit] += 1
+
+    return statistics
+
+
+def _init_worker(gal_code, targets):
+    global _worker_simulator, _worker_targets
+    _worker_simulator = _build_simulator(gal_code)
+    _worker_targets = compile_targets(_worker_simulator.net, targets)
+
+
+def _run_chunk(walks, max_steps, seed):
+    return _run_walks(_worker_simulator, _worker_targets, walks, max_steps, seed)
+
+
+def _merge(total, part):
+    for key in ("walks", "steps", "deadlocks", "unsafe_hits"):
+        total[key] += part[key]
+    for place, histogram in part["occupancy"].items():
+        total["occupancy"][place].update(histogram)
+    total["first_hit_steps"].update(part["first_hit_steps"])
+
+
+def _summarize(statistics):
+    walks = statistics["walks"] or 1
+    first_hits = statistics["first_hit_steps"]
+    hit_steps = sorted(first_hits.elements())
+    return {
+        "walks": statistics["walks"],
+        "total_steps": statistics["steps"],
+        "mean_walk_length": statistics["steps"] / walks,
+        "deadlocks": statistics["deadlocks"],
+        "deadlock_frequency": statistics["deadlocks"] / walks,
+        "unsafe_hits": statistics["unsafe_hits"],
+        "unsafe_hit_frequency": statistics["unsafe_hits"] / walks,
+        "occupancy": {
+            place: {str(value): count for value, count in sorted(histogram.items())}
+            for place, histogram in statistics["occupancy"].items()
+        },
+        "first_hit_steps": {str(step): count for step, count in sorted(first_hits.items())},
+        "mean_first_hit_step": sum(hit_steps) / len(hit_steps) if hit_steps else None,
+        "median_first_hit_step": hit_steps[len(hit_steps) // 2] if hit_steps else None,
+    }
+
+
+# Runs `walks` seeded random walks of PetriNetSimulator.simulate and returns
+# aggregate statistics. Walk i always uses the same seed for a given `seed`, so
+# results do not depend on the number of workers.
+def run_monte_carlo(gal_code, walks=1000, max_steps=25, seed=0, workers=None, targets=None):
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, walks))
+
+    if workers == 1:
+        simulator = _build_simulator(gal_code)
+        statistics = _run_walks(simulator, compile_targets(simulator.net, targets), range(walks), max_steps, seed)
+        return _summarize(statistics)
+
+    chunk_size = max(1, -(-walks // (workers * 4)))
+    chunks = [range(start, min(start + chunk_size, walks)) for start in range(0, walks, chunk_size)]
+
+    statistics = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(gal_code, targets)) as pool:
+        for part in pool.map(_run_chunk, chunks, [max_steps] * len(chunks), [seed] * len(chunks)):
+            if statistics is None:
+                statistics = part
+            else:
+                _merge(statistics, part)
+
+    return _summarize(statistics)
@@ -0,0 +1,132 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from spec_parser import content_lines
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_SEPARATOR_SPACE = re.compile(r"\s*([,:])\s*")
+
+
+# Drops comments and blank lines exactly like the spec parser does and
+# canonicalizes whitespace, so specs that only differ in formatting map to the
+# same cache key.
+def normalize_spec(text):
+    lines = []
+    for line in content_lines(text):
+        line = _WHITESPACE.sub(" ", line)
+        lines.append(_SEPARATOR_SPACE.sub(r"\1", line))
+    return "\n".join(lines)
+
+
+def cache_key(kind, text, options=()):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([kind, list(options)]).encode())
+    digest.update(b"\0")
+    digest.update(normalize_spec(text).encode())
+    return digest.hexdigest()
+
+
+# Two-tier cache of pipeline artifacts. Values must be JSON-serializable. The
+# memory tier is an LRU bounded by the total serialized size of its entries;
+# the optional disk tier keeps one JSON file per key and survives restarts.
+class PipelineCache:
+    def __init__(self, max_bytes, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key, payload):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        if len(payload) > self.max_bytes:
+            return
+        self._entries[key] = payload
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r") as f:
+                    payload = f.read()
+            except OSError:
+                payload = None
+            if payload is not None:
+                with self._lock:
+                    self._remember(key, payload)
+                    self.disk_hits += 1
+                return json.loads(payload)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        with self._lock:
+            self._remember(key, payload)
+        if self.disk_dir:
+            self._write(key, payload)
+
+    # Each writer gets its own temporary file, so concurrent puts of one key just
+    # replace each other's complete file. A failed write only loses the disk copy.
+    def _write(self, key, payload):
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=f"{key}.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            logger.warning("Could not write cache entry %s: %s", key, e)
+            with self._lock:
+                self.disk_errors += 1
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_errors": self.disk_errors,
+            }
+
+
+def cache_from_environment():
+    max_bytes = int(os.environ.get("PIPELINE_CACHE_BYTES", 64 * 1024 * 1024))
+    return PipelineCache(max_bytes, os.environ.get("PIPELINE_CACHE_DIR") or None)
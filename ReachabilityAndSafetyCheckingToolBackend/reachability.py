@@ -0,0 +1,169 @@
+import operator
+from collections import deque
+
+from simulator import CompiledNet
+from state_store import VisitedStore, pack_marking
+from stubborn import StubbornSets
+
+
+# With reduction=True every marking only fires the enabled transitions of a
+# stubborn set (see stubborn.py): verdicts stay exact, explored_states drops.
+# Visited markings are kept in a VisitedStore that moves them to a memory-mapped
+# file in spill_dir once hot_states of them are in memory; the frontier holds
+# packed markings too.
+class ReachabilityExplorer:
+    def __init__(self, net, reduction=False, hot_states=None, spill_dir=None):
+        self.net = net
+        self.reduction = reduction
+        self.hot_states = hot_states
+        self.spill_dir = spill_dir
+        self.explored_states = 0
+        self.spilled_states = 0
+        self.exhausted = False
+        self._stubborn = None
+
+    @classmethod
+    def from_gal_transitions(cls, galVariables, galTransitions, reduction=False, hot_states=None, spill_dir=None):
+        return cls(CompiledNet(galVariables, galTransitions), reduction, hot_states, spill_dir)
+
+    def _visited_store(self):
+        return VisitedStore(len(self.net.places), self.hot_states, self.spill_dir)
+
+    def _stubborn_sets(self):
+        if self._stubborn is None:
+            self._stubborn = StubbornSets(self._transitions(), len(self.net.places))
+        return self._stubborn
+
+    # Targets are dicts of place -> value; a marking hits a target when every
+    # place the target names has exactly that value. Targets over the same set of
+    # places (the usual case) are matched with a single projection and set lookup.
+    def _group_targets(self, targets):
+        groups = {}
+        for i, target in enumerate(targets):
+            places = tuple(sorted(self.net.place_index[place] for place in target))
+            values = tuple(target[self.net.places[idx]] for idx in places)
+            groups.setdefault(places, {}).setdefault(values, []).append(i)
+        return groups
+
+    # Breadth-first search from the initial marking. Returns the set of indices of
+    # the targets that are reachable; the search stops early once all are found,
+    # or once any is found with stop_on_first. self.exhausted tells whether the
+    # whole state space was explored, i.e. whether targets not found are unreachable.
+    # The state space is finite because initialTrans is guarded by count < 50.
+    def search(self, targets, max_states=None, stop_on_first=False):
+        groups = self._group_targets(targets)
+        found = set()
+        initial = pack_marking(self.net.initial_marking)
+        self.explored_states = 0
+        with self._visited_store() as visited:
+            visited.add(initial)
+            self._explore(deque([initial]), visited, self._transitions(), groups, found, len(targets),
+                          max_states, stop_on_first)
+            self.spilled_states = visited.spilled_keys()
+        return found
+
+    # (guard, changes) of every transition; guards `bound_place < N` compare
+    # against `bound` instead of N.
+    def _transitions(self, bound_place=None, bound=None):
+        transitions = []
+        for t in self.net.transitions:
+            guard = t.guard
+            if bound_place is not None:
+                guard = tuple((idx, comparator, bound if idx == bound_place and comparator is operator.lt else constant)
+                              for idx, comparator, constant in guard)
+            transitions.append((guard, t.changes))
+        return transitions
+
+    # Expands the frontier breadth-first, adding new markings to visited and hit
+    # target indices to found. Markings with marking[bound_place] >= bound are
+    # appended to deferred, since a larger bound may enable more of their successors.
+    def _explore(self, frontier, visited, transitions, groups, found, targets, max_states, stop_on_first,
+                 bound_place=None, bound=None, deferred=None):
+        self.exhausted = False
+        remaining = targets - len(found)
+        stubborn = self._stubborn_sets() if self.reduction else None
+        live_targets = None
+        # The hot tier is emptied, not replaced, when it spills.
+        hot, visit = visited.hot, visited.add
+
+        while frontier:
+            marking = frontier.popleft()
+            self.explored_states += 1
+            if deferred is not None and marking[bound_place] >= bound:
+                deferred.append(marking)
+
+            for places, values in groups.items():
+                hit = values.get(tuple(marking[idx] for idx in places))
+                if hit:
+                    for i in hit:
+                        if i not in found:
+                            found.add(i)
+                            remaining -= 1
+            if remaining == 0 or (stop_on_first and found):
+                break
+            if max_states is not None and self.explored_states >= max_states:
+                break
+
+            candidates = transitions
+            if stubborn is not None:
+                if live_targets is None or live_remaining != remaining:
+                    live_targets = [(places, values) for places, byValues in groups.items()
+                                    for values, indices in byValues.items() if any(i not in found for i in indices)]
+                    live_remaining = remaining
+                candidates = [transitions[t] for t in stubborn.enabled_stubborn(
+                    transitions, marking, stubborn.enabled(transitions, marking), live_targets)]
+
+            for guard, changes in candidates:
+                enabled = True
+                for idx, comparator, constant in guard:
+                    if not comparator(marking[idx], constant):
+                        enabled = False
+                        break
+                if not enabled:
+                    continue
+                successor = list(marking)
+                for idx, amount in changes:
+                    successor[idx] += amount
+                    if successor[idx] < 0:
+                        enabled = False
+                        break
+                if not enabled:
+                    continue
+                key = pack_marking(successor)
+                if key not in hot and visit(key):
+                    frontier.append(key)
+        else:
+            self.exhausted = True
+
+    # Searches under the agent bounds in `bounds` (ascending), treating every guard
+    # `bound_place < N` as `bound_place < bound`. The reachable markings under one
+    # bound stay reachable under a larger one, so each round keeps the markings
+    # visited so far and only re-expands the ones the previous bound held back.
+    # Yields (bound, found) after each round, with self.exhausted telling whether
+    # that bound's state space was explored completely, and stops after the first
+    # round that finds a target. stop_on_first ends that round at the first target.
+    def deepen(self, targets, bounds, bound_place="count", max_states=None, stop_on_first=False):
+        groups = self._group_targets(targets)
+        found = set()
+        bound_idx = self.net.place_index[bound_place]
+        initial = pack_marking(self.net.initial_marking)
+        frontier = deque([initial])
+        self.explored_states = 0
+
+        with self._visited_store() as visited:
+            visited.add(initial)
+            for bound in bounds:
+                deferred = []
+                self._explore(frontier, visited, self._transitions(bound_idx, bound), groups, found, len(targets),
+                              max_states, stop_on_first, bound_idx, bound, deferred)
+                self.spilled_states = visited.spilled_keys()
+                yield bound, found
+                if found or not self.exhausted:
+                    return
+                frontier = deque(deferred)
+
+    # True/False, or None if max_states stopped the search before it was decided.
+    def is_reachable(self, target, max_states=None):
+        if self.search([target], max_states=max_states):
+            return True
+        return False if self.exhausted else None
@@ -1,35 +1,240 @@
+import heapq
+import json
 import random
-import copy
+import operator
+import sys
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from incidence import IncidenceEngine
+from state_store import pack_marking
+
+# Checked in this order so that ">=" is not mistaken for ">" (same as the old string parser).
+GUARD_OPERATORS = [
+    (">=", operator.ge),
+    ("<=", operator.le),
+    ("==", operator.eq),
+    ("!=", operator.ne),
+    (">", operator.gt),
+    ("<", operator.lt),
+]
+
+# Nets with at least this many transitions find their enabled transitions with
+# one vectorized IncidenceEngine comparison instead of a loop over transitions.
+VECTORIZED_MIN_TRANSITIONS = 64
+
+# guard:   tuple of (place index, comparator, constant)
+# effects: tuple of (place index, signed amount) in source order
+# delta:   net change for every place, len(delta) == len(places)
+# changes: the non-zero entries of delta as (place index, amount)
+CompiledTransition = namedtuple("CompiledTransition", ["name", "guard", "effects", "delta", "changes"])
+
+
+class CompiledNet:
+    def __init__(self, variables, transitions):
+        self.places = list(variables)
+        self.place_index = {place: i for i, place in enumerate(self.places)}
+
+        compiled = []
+        for name, (guard, actions) in transitions.items():
+            compiled.append((name, self._compile_guard(guard), self._compile_actions(actions)))
+
+        # Places only referenced by guards/actions start at 0, like marking.get(var, 0) did.
+        self.initial_marking = [variables.get(place, 0) for place in self.places]
+
+        self.transitions = []
+        for name, guard_terms, effects in compiled:
+            delta = [0] * len(self.places)
+            for idx, amount in effects:
+                delta[idx] += amount
+            changes = tuple((idx, amount) for idx, amount in enumerate(delta) if amount)
+            self.transitions.append(CompiledTransition(name, guard_terms, effects, tuple(delta), changes))
+
+        self.transition_index = {t.name: i for i, t in enumerate(self.transitions)}
+
+    def _intern(self, place):
+        if place not in self.place_index:
+            self.place_index[place] = len(self.places)
+            self.places.append(place)
+        return self.place_index[place]
+
+    def _compile_guard(self, guard):
+        guard = guard.strip()
+        if guard.lower() == "true":
+            return ()
+
+        terms = []
+        for condition in guard.split("&&"):
+            condition = condition.strip()
+            for symbol, comparator in GUARD_OPERATORS:
+                if symbol in condition:
+                    var, val = condition.split(symbol)
+                    terms.append((self._intern(var.strip()), comparator, int(val.strip())))
+                    break
+        return tuple(terms)
+
+    def _compile_actions(self, actions):
+        if isinstance(actions, str):
+            actions = actions.split(";")
+
+        effects = []
+        for action in actions:
+            action = action.strip().rstrip(";")
+            if "+=" in action:
+                var, val = action.split("+=")
+                effects.append((self._intern(var.strip()), int(val.strip())))
+            elif "-=" in action:
+                var, val = action.split("-=")
+                effects.append((self._intern(var.strip()), -int(val.strip())))
+        return tuple(effects)
+
+    # (guard terms, changes) of a GAL guard and actions, without adding a
+    # transition to the net or building its dense delta.
+    def compile_transition(self, guard, actions):
+        guard_terms = self._compile_guard(guard)
+        net = {}
+        for idx, amount in self._compile_actions(actions):
+            net[idx] = net.get(idx, 0) + amount
+        return guard_terms, tuple((idx, amount) for idx, amount in sorted(net.items()) if amount)
+
+    def to_dict(self, marking):
+        return dict(zip(self.places, marking))
+
+    def from_dict(self, values):
+        return [values.get(place, 0) for place in self.places]
+
+    def is_enabled(self, transition, marking):
+        for idx, comparator, constant in transition.guard:
+            if not comparator(marking[idx], constant):
+                return False
+        for idx, amount in transition.changes:
+            if marking[idx] + amount < 0:
+                return False
+        return True
+
+    def fire(self, transition, marking):
+        result = list(marking)
+        for idx, amount in transition.changes:
+            result[idx] += amount
+        return result
+
+
+# Receives PetriNetSimulator events; override the callbacks you need. Markings are
+# lists indexed like net.places that the simulator keeps updating, so copy them to
+# keep them; fireable holds the enabled CompiledTransitions. With no observer
+# attached the simulator does no extra work.
+class SimulationObserver:
+    def on_parse(self, net):
+        pass
+
+    def on_step(self, net, step, marking, fireable):
+        pass
+
+    def on_fire(self, net, step, transition_name, marking):
+        pass
+
+    def on_deadlock(self, net, step, marking):
+        pass
+
+
+# Human-readable trace of a simulation, like the simulator used to print.
+class VerboseObserver(SimulationObserver):
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def _write(self, text):
+        self.stream.write(text + "\n")
+
+    def on_parse(self, net):
+        self._write(f"Parsed {len(net.places)} places and {len(net.transitions)} transitions.")
+        for transition in net.transitions:
+            self._write(f"  {transition.name}: {transition.changes}")
+
+    def on_step(self, net, step, marking, fireable):
+        self._write(f"\n--- Step {step} ---")
+        self._write(f"Marking: {net.to_dict(marking)}")
+        self._write(f"Fireable transitions: {[transition.name for transition in fireable]}")
+
+    def on_fire(self, net, step, transition_name, marking):
+        self._write(f"🔥 Firing transition: {transition_name}")
+        self._write(f"New marking: {net.to_dict(marking)}")
+
+    def on_deadlock(self, net, step, marking):
+        self._write("No fireable transitions. Simulation halts.")
+
+
+# Counts steps, firings per transition, deadlocks and enabled transitions,
+# without formatting any marking. With a state_store.VisitedStore as `visited`
+# it also counts the distinct markings stepped through.
+class StatisticsObserver(SimulationObserver):
+    def __init__(self, visited=None):
+        self.visited = visited
+        self.parses = 0
+        self.steps = 0
+        self.deadlocks = 0
+        self.enabled = 0
+        self.max_enabled = 0
+        self.fired = Counter()
+
+    def on_parse(self, net):
+        self.parses += 1
+
+    def on_step(self, net, step, marking, fireable):
+        self.steps += 1
+        self.enabled += len(fireable)
+        self.max_enabled = max(self.max_enabled, len(fireable))
+        if self.visited is not None:
+            self.visited.add(pack_marking(marking))
+
+    def on_fire(self, net, step, transition_name, marking):
+        self.fired[transition_name] += 1
+
+    def on_deadlock(self, net, step, marking):
+        self.deadlocks += 1
+
+    def summary(self):
+        summary = {
+            "steps": self.steps,
+            "firings": sum(self.fired.values()),
+            "deadlocks": self.deadlocks,
+            "mean_enabled": self.enabled / self.steps if self.steps else 0,
+            "max_enabled": self.max_enabled,
+            "fired": dict(self.fired),
+        }
+        if self.visited is not None:
+            summary["distinct_markings"] = len(self.visited)
+        return summary
+
 
 class PetriNetSimulator:
-    def __init__(self, gal_code):
-        self.variables = {} 
-        self.transitions = {} 
+    def __init__(self, gal_code, observers=()):
+        self.variables = {}
+        self.transitions = {}
+        self.observers = list(observers)
+        self.search_expanded = 0
+        self.search_exhausted = False
         self._parse_gal_code(gal_code)
 
     def _parse_gal_code(self, gal_code):
         lines = gal_code.strip().splitlines()
         current_transition = None
 
-        print("Parsing GAL code...\n")
-
         for line in lines:
             line = line.strip()
             if not line:
                 continue
-                
+
             if line.startswith("int"):
                 var, val = line.replace(";", "").split("=")
                 var_name = var.split()[1].strip()
                 self.variables[var_name] = int(val.strip())
-                print(f"Declared variable: {var_name} = {self.variables[var_name]}")
 
             elif line.startswith("transition"):
                 name = line.split("transition")[1].split("[")[0].strip()
                 guard = line.split("[")[1].split("]")[0].strip()
                 current_transition = name
                 self.transitions[name] = (guard, [])
-                print(f"\nFound transition: {name} with guard: '{guard}'")
 
             elif current_transition and ";" in line:
                 # Parse actions
@@ -38,118 +243,264 @@ class PetriNetSimulator:
                     action = action.strip()
                     if action:
                         actions.append(action)
-                        print(f"  Parsed action: {action}")
                 self.transitions[current_transition] = (self.transitions[current_transition][0], actions)
 
-        print("\nFinished parsing.\n")
+        # Guards and actions are compiled once here; every step afterwards works on
+        # integer markings indexed by self.net.place_index.
+        self.net = CompiledNet(self.variables, self.transitions)
+        self.incidence = IncidenceEngine(self.net) if len(self.net.transitions) >= VECTORIZED_MIN_TRANSITIONS else None
 
-    def _evaluate_guard(self, guard, marking):
-        print(f"  Evaluating guard: '{guard}' with marking: {marking}")
-        if guard.lower() == "true":
-            print("    Guard is 'true' → passes ✅")
-            return True
+        for observer in self.observers:
+            observer.on_parse(self.net)
 
-        for condition in guard.split("&&"):
-            condition = condition.strip()
-            if ">=" in condition:
-                var, val = condition.split(">=")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) < int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) < {val}")
-                    return False
-            elif "<=" in condition:
-                var, val = condition.split("<=")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) > int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) > {val}")
-                    return False
-            elif "==" in condition:
-                var, val = condition.split("==")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) != int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) != {val}")
-                    return False
-            elif "!=" in condition:
-                var, val = condition.split("!=")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) == int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) == {val}")
-                    return False
-            elif ">" in condition:
-                var, val = condition.split(">")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) <= int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) <= {val}")
-                    return False
-            elif "<" in condition:
-                var, val = condition.split("<")
-                var, val = var.strip(), val.strip()
-                if marking.get(var, 0) >= int(val):
-                    print(f"    Guard failed: {var} ({marking.get(var,0)}) >= {val}")
-                    return False
-
-        print("    Guard passed ✅")
-        return True
+    def _fireable(self, marking):
+        net = self.net
+        if self.incidence is not None:
+            transitions = net.transitions
+            return [transitions[t] for t in np.flatnonzero(self.incidence.enabled(marking))]
+        return [t for t in net.transitions if net.is_enabled(t, marking)]
 
-    def _apply_actions(self, actions, marking):
-        print(f"  Applying actions: {actions} to marking: {marking}")
-        result = copy.deepcopy(marking)
-        for action in actions:
-            if "+=" in action:
-                var, val = action.split("+=")
-                var, val = var.strip(), val.strip()
-                result[var] = result.get(var, 0) + int(val)
-                print(f"    {var} += {val} → {result[var]}")
-            elif "-=" in action:
-                var, val = action.split("-=")
-                var, val = var.strip(), val.strip()
-                result[var] = result.get(var, 0) - int(val)
-                print(f"    {var} -= {val} → {result[var]}")
-        return result
+    # (transition index, packed successor) for every transition enabled in the
+    # packed marking `key`.
+    def _successors(self, key):
+        net = self.net
+        if self.incidence is not None:
+            marking = np.frombuffer(key, dtype=np.uint8) if type(key) is bytes else key
+            fireable, successors = self.incidence.successors(marking)
+            return zip(fireable.tolist(), map(pack_marking, successors.tolist()))
+        return [(t, pack_marking(net.fire(transition, key)))
+                for t, transition in enumerate(net.transitions) if net.is_enabled(transition, key)]
+
+    # observers are attached for this run only, in addition to self.observers;
+    # verbose=True adds a VerboseObserver printing to stdout. The marking is
+    # updated in place and only the fired transitions are recorded.
+    def simulate_compact(self, max_steps=100, rng=None, verbose=False, observers=()):
+        rng = rng or random
+        net = self.net
+        observers = self.observers + list(observers)
+        if verbose:
+            observers.append(VerboseObserver())
 
-    def _get_fireable_transitions(self, marking):
-        print("\nChecking fireable transitions...")
-        fireable = []
-        for name, (guard, actions) in self.transitions.items():
-            print(f" Checking transition: {name}")
-            if self._evaluate_guard(guard, marking):
-                new_marking = self._apply_actions(actions, marking)
-                if all(v >= 0 for v in new_marking.values()):
-                    fireable.append((name, new_marking))
-                    print(f"  ✅ Transition {name} is fireable.")
-                else:
-                    print(f"  ❌ Transition {name} leads to negative values → skipped.")
-            else:
-                print(f"  ❌ Guard for {name} not satisfied → skipped.")
-        return fireable
-
-    def simulate(self, max_steps=100):
-        current = copy.deepcopy(self.variables)
-        trace = [("initial", copy.deepcopy(current))]
-
-        print("\n===== Starting Simulation =====\n")
-        print(f"Initial marking: {current}\n")
-
-        for step in range(max_steps):
-            print(f"\n--- Step {step+1} ---")
-            fireable = self._get_fireable_transitions(current)
+        current = list(net.initial_marking)
+        trace = CompactTrace(net, current)
+        fired = trace.transitions
+
+        for step in range(1, max_steps + 1):
+            fireable = self._fireable(current)
+            for observer in observers:
+                observer.on_step(net, step, current, fireable)
 
             if not fireable:
-                print("No fireable transitions. Simulation halts.\n")
+                for observer in observers:
+                    observer.on_deadlock(net, step, current)
                 break
 
-            transition_name, next_marking = random.choice(fireable)
-            print(f"\n🔥 Firing transition: {transition_name}")
-            print(f"New marking: {next_marking}")
-            trace.append((transition_name, copy.deepcopy(next_marking)))
-            current = next_marking
+            transition = rng.choice(fireable)
+            for idx, amount in transition.changes:
+                current[idx] += amount
+            fired.append(net.transition_index[transition.name])
+            for observer in observers:
+                observer.on_fire(net, step, transition.name, current)
 
-        print("\n===== Simulation Finished =====\n")
         return trace
 
+    # [("initial", marking dict), (transition name, marking dict), ...]
+    def simulate(self, max_steps=100, rng=None, verbose=False, observers=()):
+        return self.simulate_compact(max_steps, rng, verbose, observers).to_full()
+
+    # Lower bound on the number of firings from a marking to one that agrees with
+    # `target` ((place index, value) pairs), or None if no transition moves some
+    # place the way it has to go. One firing changes a place by at most its largest
+    # delta, and all target places together by at most the largest sum.
+    def _distance_function(self, target):
+        transitions = self.net.transitions
+        up = {idx: max([t.delta[idx] for t in transitions] + [0]) for idx, _ in target}
+        down = {idx: max([-t.delta[idx] for t in transitions] + [0]) for idx, _ in target}
+        total_step = max([sum(abs(t.delta[idx]) for idx, _ in target) for t in transitions] + [0])
+
+        def distance(marking):
+            longest = 0
+            total = 0
+            for idx, wanted in target:
+                diff = wanted - marking[idx]
+                if diff:
+                    step = up[idx] if diff > 0 else down[idx]
+                    if not step:
+                        return None
+                    diff = abs(diff)
+                    longest = max(longest, -(-diff // step))
+                    total += diff
+            return max(longest, -(-total // total_step)) if total else 0
+
+        return distance
+
+    # Directed search for a marking that agrees with `target` (place -> value): A*
+    # over markings with priority steps + weight * _distance_function. The distance
+    # never overestimates, so weight=1 finds a shortest firing sequence; larger
+    # weights expand fewer markings but may return a longer one. Returns the
+    # sequence as a CompactTrace, or None if there is none or max_states markings
+    # were expanded first; self.search_exhausted is True only in the first case.
+    def search_trace(self, target, max_states=100000, weight=1):
+        net = self.net
+        for place in target:
+            if place not in net.place_index:
+                raise ValueError(f"Unknown place '{place}'")
+        target = [(net.place_index[place], int(value)) for place, value in target.items()]
+        distance = self._distance_function(target)
+
+        initial = pack_marking(net.initial_marking)
+        parents = {initial: None}
+        steps = {initial: 0}
+        closed = set()
+        order = 0
+        open_heap = []
+        remaining = distance(initial)
+        if remaining is not None:
+            open_heap.append((weight * remaining, remaining, order, initial))
+        self.search_expanded = 0
+        self.search_exhausted = False
+
+        while open_heap:
+            _, remaining, _, key = heapq.heappop(open_heap)
+            if key in closed:
+                continue
+            if remaining == 0:
+                transitions = []
+                while parents[key] is not None:
+                    key, t = parents[key]
+                    transitions.append(t)
+                trace = CompactTrace(net, net.initial_marking)
+                trace.transitions = transitions[::-1]
+                return trace
+            if self.search_expanded >= max_states:
+                return None
+            closed.add(key)
+            self.search_expanded += 1
+
+            cost = steps[key] + 1
+            for t, successor in self._successors(key):
+                if successor in closed or steps.get(successor, cost + 1) <= cost:
+                    continue
+                remaining = distance(successor)
+                if remaining is None:
+                    continue
+                steps[successor] = cost
+                parents[successor] = (key, t)
+                order += 1
+                heapq.heappush(open_heap, (cost + weight * remaining, remaining, order, successor))
+
+        self.search_exhausted = True
+        return None
+
+
+# A simulation run as its initial marking and the indices of the fired transitions.
+# Markings are replayed from the transition deltas on demand.
+class CompactTrace:
+    def __init__(self, net, initial):
+        self.net = net
+        self.initial = tuple(initial)
+        self.transitions = []
+
+    def __len__(self):
+        return len(self.transitions) + 1
+
+    # Yields the marking before the first step and after every step. The same list
+    # is updated and yielded again, so copy it to keep it.
+    def markings(self):
+        marking = list(self.initial)
+        yield marking
+        for t in self.transitions:
+            for idx, amount in self.net.transitions[t].changes:
+                marking[idx] += amount
+            yield marking
+
+    def to_full(self):
+        names = ["initial"] + [self.net.transitions[t].name for t in self.transitions]
+        return [(name, self.net.to_dict(marking)) for name, marking in zip(names, self.markings())]
+
+    def header(self):
+        return {
+            "places": self.net.places,
+            "transitions": [t.name for t in self.net.transitions],
+            "initial": list(self.initial),
+        }
+
+    # Every step is [transition index, place index, new value, place index, new value, ...]
+    # for the places the transition changed.
+    def to_json(self):
+        steps = []
+        marking = list(self.initial)
+        for t in self.transitions:
+            step = [t]
+            for idx, amount in self.net.transitions[t].changes:
+                marking[idx] += amount
+                step += (idx, marking[idx])
+            steps.append(step)
+        return dict(self.header(), format="compact", steps=steps)
+
+    # TRACE_MAGIC, the JSON header's length as a varint, the header, the step count
+    # and then the steps as varints: transition index, number of changed places and
+    # (place index, zigzag-encoded new value) for each of them.
+    def to_binary(self):
+        header = json.dumps(self.header(), separators=(",", ":")).encode()
+        out = bytearray(TRACE_MAGIC)
+        _write_varint(out, len(header))
+        out += header
+        _write_varint(out, len(self.transitions))
+        marking = list(self.initial)
+        for t in self.transitions:
+            changes = self.net.transitions[t].changes
+            _write_varint(out, t)
+            _write_varint(out, len(changes))
+            for idx, amount in changes:
+                marking[idx] += amount
+                _write_varint(out, idx)
+                _write_varint(out, _zigzag(marking[idx]))
+        return bytes(out)
+
+
+TRACE_MAGIC = b"PNT1"
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
 
 
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
 
-        
 
-   
+# Inverse of CompactTrace.to_binary, returning the same dict as to_json.
+def decode_binary_trace(data):
+    if data[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+        raise ValueError("Not a binary simulation trace")
+    length, pos = _read_varint(data, len(TRACE_MAGIC))
+    trace = json.loads(data[pos:pos + length])
+    count, pos = _read_varint(data, pos + length)
+    steps = []
+    for _ in range(count):
+        t, pos = _read_varint(data, pos)
+        changed, pos = _read_varint(data, pos)
+        step = [t]
+        for _ in range(changed):
+            idx, pos = _read_varint(data, pos)
+            value, pos = _read_varint(data, pos)
+            step += (idx, value >> 1 if not value & 1 else -(value >> 1) - 1)
+        steps.append(step)
+    trace["format"] = "compact"
+    trace["steps"] = steps
+    return trace
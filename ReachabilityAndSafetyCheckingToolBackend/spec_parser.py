@@ -0,0 +1,168 @@
+# One parser for the two spec dialects: "its" (its_tool_be.py: comma separated
+# lists, agent states with a safety value such as "l0: 1, l1: 0") and "fyp"
+# (fyp_be.py: space separated lists). Both read the same sections in order:
+#
+#   agent states, agent actions, agent protocol lines ("state: actions"),
+#   agent transitions ("before,action,environment action,other actions,after"),
+#   agent initial state, agent leave state, environment states, environment
+#   actions, environment protocol lines, environment initial state, and
+#   environment transitions ("before,action,agent actions,after") to the end.
+#
+# Names of states and actions are interned to small integer IDs; everything
+# past the parser works on the IDs and only turns them back into names for
+# output.
+
+DIALECTS = ("its", "fyp")
+
+
+class Interner:
+    __slots__ = ("ids", "names")
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, name):
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+
+class AgentTransition:
+    __slots__ = ("before", "action", "environment_action", "others", "after")
+
+    def __init__(self, before, action, environment_action, others, after):
+        self.before = before
+        self.action = action
+        self.environment_action = environment_action
+        self.others = others
+        self.after = after
+
+
+class EnvironmentTransition:
+    __slots__ = ("before", "action", "agent_actions", "after", "key")
+
+    def __init__(self, before, action, agent_actions, after, key):
+        self.before = before
+        self.action = action
+        self.agent_actions = agent_actions
+        self.after = after
+        # The stripped fields as written, which identify the transition across edits.
+        self.key = key
+
+
+class Spec:
+    __slots__ = ("names", "agent_states", "safety", "agent_actions", "agent_protocols", "agent_transitions",
+                 "transition_index", "agent_initial", "agent_leave", "environment_states", "environment_actions",
+                 "environment_protocols", "environment_initial", "environment_transitions")
+
+    def __init__(self, names):
+        self.names = names
+        self.agent_states = {}
+        self.safety = {}
+        self.agent_actions = []
+        self.agent_protocols = {}
+        self.agent_transitions = []
+        # (action, environment action) -> other agents' actions -> [(before, after)]
+        self.transition_index = {}
+        self.agent_initial = None
+        self.agent_leave = None
+        self.environment_states = []
+        self.environment_actions = []
+        self.environment_protocols = {}
+        self.environment_initial = None
+        self.environment_transitions = []
+
+    def name_list(self, ids):
+        return [self.names.names[id] for id in ids]
+
+    # agentTransitions as the string keyed dict the pipelines used before the IR
+    # ("action,environment action,sorted other actions" -> [[before, after]]).
+    def agent_transitions_by_key(self):
+        names = self.names.names
+        byKey = {}
+        for t in self.agent_transitions:
+            key = f"{names[t.action]},{names[t.environment_action]},{' '.join(self.name_list(t.others))}"
+            byKey.setdefault(key, []).append([names[t.before], names[t.after]])
+        return byKey
+
+
+# Stripped non-blank lines; only lines starting with "#" in the first column are
+# comments. pipeline_cache.normalize_spec relies on the same rule.
+def content_lines(text):
+    for line in text.splitlines():
+        if line.strip() and not line.startswith("#"):
+            yield line.strip()
+
+
+def _split_list(line, dialect):
+    if dialect == "its":
+        return [item.strip() for item in line.split(",")]
+    return line.split()
+
+
+def _sorted_ids(names, items):
+    return tuple(names.intern(item) for item in sorted(items))
+
+
+# Reads the spec in one pass over its lines. Pass the Interner of an earlier
+# parse to keep IDs stable across edits of the same spec.
+def parse_spec(text, dialect="its", names=None):
+    if dialect not in DIALECTS:
+        raise ValueError(f"Unknown spec dialect '{dialect}', expected one of {list(DIALECTS)}")
+    names = names if names is not None else Interner()
+    spec = Spec(names)
+    lines = content_lines(text)
+
+    def next_line(section):
+        line = next(lines, None)
+        if line is None:
+            raise ValueError(f"Spec ended before the {section}")
+        return line
+
+    line = next_line("agent states")
+    if dialect == "its":
+        for stateInfo in line.split(","):
+            state, value = stateInfo.split(":")
+            state = state.strip()
+            spec.agent_states[state] = int(value.strip())
+            spec.safety[names.intern(state)] = spec.agent_states[state]
+    else:
+        for state in line.split():
+            spec.agent_states[state] = None
+    spec.agent_actions = _split_list(next_line("agent actions"), dialect)
+
+    line = next_line("agent transitions")
+    while ":" in line:
+        state, actions = line.split(":")
+        spec.agent_protocols[state.strip()] = [action.strip() for action in actions.split(",")]
+        line = next_line("agent transitions")
+
+    while "," in line:
+        parts = line.split(",")
+        t = AgentTransition(names.intern(parts[0].strip()), names.intern(parts[1].strip()), names.intern(parts[2].strip()),
+                            _sorted_ids(names, parts[3].split()), names.intern(parts[4].strip()))
+        spec.agent_transitions.append(t)
+        spec.transition_index.setdefault((t.action, t.environment_action), {}).setdefault(t.others, []).append((t.before, t.after))
+        line = next_line("agent initial state")
+
+    spec.agent_initial = names.intern(line)
+    spec.agent_leave = names.intern(next_line("agent leave state"))
+    spec.environment_states = _split_list(next_line("environment states"), dialect)
+    spec.environment_actions = _split_list(next_line("environment actions"), dialect)
+
+    line = next_line("environment initial state")
+    while ":" in line:
+        state, actions = line.split(":")
+        spec.environment_protocols[state.strip()] = [action.strip() for action in actions.split(",")]
+        line = next_line("environment initial state")
+    spec.environment_initial = names.intern(line)
+
+    for line in lines:
+        fields = tuple(value.strip() for value in line.split(","))
+        spec.environment_transitions.append(EnvironmentTransition(
+            names.intern(fields[0]), names.intern(fields[1]), _sorted_ids(names, fields[2].split()),
+            names.intern(fields[3]), fields))
+    return spec
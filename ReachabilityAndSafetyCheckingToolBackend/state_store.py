@@ -0,0 +1,150 @@
+import mmap
+import os
+import tempfile
+
+# Spill tables start with this many slots and double once half of them are used.
+INITIAL_SLOTS = 1 << 16
+
+
+# Markings of the generated nets stay far below 256 per place under the
+# count < 50 bound, so they pack into bytes; anything larger falls back to a tuple.
+def pack_marking(marking):
+    try:
+        return bytes(marking)
+    except ValueError:
+        return tuple(marking)
+
+
+# Open-addressing hash table of fixed-width byte keys in a memory-mapped
+# temporary file, so the kernel can page it out instead of the process running
+# out of memory. Each slot is a used flag byte followed by the key; collisions
+# probe linearly. The file is removed when the table is closed.
+class MmapHashTable:
+    def __init__(self, width, directory=None, slots=INITIAL_SLOTS):
+        self.width = width
+        self.directory = directory
+        self._slot = width + 1
+        self._count = 0
+        self._open(slots)
+
+    def _open(self, slots):
+        self._slots = slots
+        self._mask = slots - 1
+        self._file = tempfile.TemporaryFile(dir=self.directory)
+        # Truncating leaves a sparse file: only slots that are written take disk space.
+        self._file.truncate(slots * self._slot)
+        self._map = mmap.mmap(self._file.fileno(), slots * self._slot)
+
+    # (offset of the key's slot or of the empty slot it would go to, whether it is there)
+    def _find(self, key):
+        data = self._map
+        slot = self._slot
+        i = hash(key) & self._mask
+        while True:
+            offset = i * slot
+            if not data[offset]:
+                return offset, False
+            if data[offset + 1:offset + slot] == key:
+                return offset, True
+            i = (i + 1) & self._mask
+
+    def __contains__(self, key):
+        return self._find(key)[1]
+
+    def __len__(self):
+        return self._count
+
+    # Adds a key of exactly `width` bytes; returns False if it was already there.
+    def add(self, key):
+        offset, present = self._find(key)
+        if present:
+            return False
+        self._map[offset] = 1
+        self._map[offset + 1:offset + self._slot] = key
+        self._count += 1
+        if self._count * 2 > self._slots:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old_map, old_file, old_size = self._map, self._file, self._slots * self._slot
+        self._open(self._slots * 2)
+        slot = self._slot
+        for offset in range(0, old_size, slot):
+            if old_map[offset]:
+                key = old_map[offset + 1:offset + slot]
+                new_offset, _ = self._find(key)
+                self._map[new_offset] = 1
+                self._map[new_offset + 1:new_offset + slot] = key
+        old_map.close()
+        old_file.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+# Set of packed markings. Up to hot_capacity keys live in an in-memory set; when
+# it fills up they move to an MmapHashTable (in `directory`, default the system
+# temp dir) and the set starts over. Keys that do not fit the fixed width (tuples
+# from pack_marking) always stay in memory. hot_capacity=None never spills.
+class VisitedStore:
+    def __init__(self, width, hot_capacity=None, directory=None):
+        self.width = width
+        self.hot_capacity = hot_capacity
+        self.directory = directory
+        self.hot = set()
+        self.wide = set()
+        self.spilled = None
+        self.spills = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, key):
+        if type(key) is not bytes:
+            return key in self.wide
+        return key in self.hot or (self.spilled is not None and key in self.spilled)
+
+    def __len__(self):
+        return len(self.hot) + len(self.wide) + (len(self.spilled) if self.spilled is not None else 0)
+
+    # Returns True if the key is new.
+    def add(self, key):
+        if type(key) is not bytes:
+            if key in self.wide:
+                return False
+            self.wide.add(key)
+            return True
+        if key in self.hot or (self.spilled is not None and key in self.spilled):
+            return False
+        self.hot.add(key)
+        if self.hot_capacity is not None and len(self.hot) >= self.hot_capacity:
+            self.spill()
+        return True
+
+    def spill(self):
+        if self.spilled is None:
+            self.spilled = MmapHashTable(self.width, self.directory)
+        for key in self.hot:
+            self.spilled.add(key)
+        self.hot.clear()
+        self.spills += 1
+
+    def spilled_keys(self):
+        return len(self.spilled) if self.spilled is not None else 0
+
+    def close(self):
+        if self.spilled is not None:
+            self.spilled.close()
+            self.spilled = None
+
+
+# Hot tier size and spill directory from VISITED_HOT_STATES (default 1000000
+# markings, 0 keeps everything in memory) and VISITED_SPILL_DIR.
+def store_options_from_environment():
+    hot_capacity = int(os.environ.get("VISITED_HOT_STATES", 1000000)) or None
+    return hot_capacity, os.environ.get("VISITED_SPILL_DIR") or None
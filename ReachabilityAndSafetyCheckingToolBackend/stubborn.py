@@ -0,0 +1,138 @@
+import operator
+
+
+# Number of transitions in a bitmask; int.bit_count needs Python 3.10 and the
+# Docker image runs 3.9.
+def _size(mask):
+    return bin(mask).count("1")
+
+
+# Stubborn sets that keep the reachability of target markings exact. From a
+# marking that is no target, one of the places a target disagrees on has to move
+# towards the target value, so every path to the target fires one of the
+# transitions doing that (an up-set). The stubborn set starts from such an
+# up-set for every target still searched for and is closed under
+#   - enabled members: every transition that writes a place the member reads
+#     (guard places and places it takes tokens from), or reads a place it writes;
+#   - disabled members: every transition that can repair one failing condition
+#     of the member (a necessary enabling set).
+# On a shortest path to a target the first stubborn transition is then enabled
+# and commutes with the transitions before it, so firing only the enabled
+# stubborn transitions still reaches every reachable target, with no cycle
+# proviso needed since the remaining distance shrinks with every step.
+#
+# Transitions are (guard, changes) pairs like ReachabilityExplorer uses; guard
+# constants may differ between calls, but not the places they read.
+class StubbornSets:
+    def __init__(self, transitions, num_places):
+        self.increasers = [0] * num_places
+        self.decreasers = [0] * num_places
+        self.changers = [0] * num_places
+        readers = [0] * num_places
+        reads = []
+
+        # Sets of transitions are bitmasks over transition indices.
+        for t, (guard, changes) in enumerate(transitions):
+            bit = 1 << t
+            for idx, amount in changes:
+                if amount > 0:
+                    self.increasers[idx] |= bit
+                else:
+                    self.decreasers[idx] |= bit
+                self.changers[idx] |= bit
+            read = {idx for idx, _, _ in guard} | {idx for idx, amount in changes if amount < 0}
+            reads.append(read)
+            for idx in read:
+                readers[idx] |= bit
+
+        self.interferers = []
+        for t, (_, changes) in enumerate(transitions):
+            interfering = 0
+            for idx in reads[t]:
+                interfering |= self.changers[idx]
+            for idx, _ in changes:
+                interfering |= readers[idx]
+            self.interferers.append(interfering & ~(1 << t))
+
+    # Bitmask of the transitions enabled at `marking`.
+    def enabled(self, transitions, marking):
+        enabled = 0
+        for t, (guard, changes) in enumerate(transitions):
+            if all(comparator(marking[idx], constant) for idx, comparator, constant in guard) and \
+                    all(marking[idx] + amount >= 0 for idx, amount in changes):
+                enabled |= 1 << t
+        return enabled
+
+    # Transitions that can move `value` towards `wanted`.
+    def _towards(self, idx, value, wanted):
+        if value < wanted:
+            return self.increasers[idx]
+        if value > wanted:
+            return self.decreasers[idx]
+        return 0
+
+    # The smallest set of transitions one of which must fire before a disabled
+    # transition can be enabled.
+    def _enabling_set(self, guard, changes, marking):
+        best = None
+        for idx, comparator, constant in guard:
+            value = marking[idx]
+            if comparator(value, constant):
+                continue
+            if comparator is operator.ge or comparator is operator.gt:
+                candidates = self.increasers[idx]
+            elif comparator is operator.le or comparator is operator.lt:
+                candidates = self.decreasers[idx]
+            elif comparator is operator.eq:
+                candidates = self._towards(idx, value, constant)
+            else:
+                candidates = self.changers[idx]
+            if best is None or _size(candidates) < _size(best):
+                best = candidates
+        for idx, amount in changes:
+            if marking[idx] + amount < 0:
+                candidates = self.increasers[idx]
+                if best is None or _size(candidates) < _size(best):
+                    best = candidates
+        return best
+
+    # Indices of the enabled transitions of a stubborn set at `marking`, in
+    # ascending order. `enabled` is the bitmask of the enabled transitions and
+    # targets are (places, values) pairs none of which `marking` already hits.
+    def enabled_stubborn(self, transitions, marking, enabled, targets):
+        stubborn = 0
+        for places, values in targets:
+            best = None
+            for idx, wanted in zip(places, values):
+                if marking[idx] == wanted:
+                    continue
+                candidates = self._towards(idx, marking[idx], wanted)
+                if best is None or _size(candidates) < _size(best):
+                    best = candidates
+                # No transition moves this place the right way: the target is unreachable from here.
+                if not candidates:
+                    break
+            if best:
+                stubborn |= best
+
+        pending = stubborn
+        while pending and enabled & ~stubborn:
+            low = pending & -pending
+            pending ^= low
+            t = low.bit_length() - 1
+            if enabled & low:
+                needed = self.interferers[t]
+            else:
+                guard, changes = transitions[t]
+                needed = self._enabling_set(guard, changes, marking)
+            needed &= ~stubborn
+            stubborn |= needed
+            pending |= needed
+
+        chosen = enabled & stubborn
+        result = []
+        while chosen:
+            low = chosen & -chosen
+            chosen ^= low
+            result.append(low.bit_length() - 1)
+        return result
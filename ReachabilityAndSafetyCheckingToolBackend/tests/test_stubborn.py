@@ -0,0 +1,53 @@
+# Partial-order reduction must not change any reachability verdict: every target
+# is searched with and without stubborn sets and the answers compared.
+#
+#   python -m pytest tests
+import os
+import random
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+import its_tool_be
+from reachability import ReachabilityExplorer
+from synthetic_spec import generate_spec
+
+AGENT_BOUND = 4
+
+
+def generated_net(seed):
+    spec = its_tool_be.readInput(generate_spec(agent_states=5, agent_transitions=12, environment_transitions=4,
+                                               seed=seed), "test")
+    galVariables = its_tool_be.initializeGalVariables(spec.agent_states, spec.environment_states,
+                                                      spec.names.names[spec.environment_initial], "test")
+    globalTransitions = its_tool_be.iterGlobalTransitions(spec, spec.environment_transitions, "test")
+    galTransitions, unsafeMarkings = its_tool_be.globalToGalTransitions(globalTransitions, spec, "test")
+    galTransitions["initialTrans"] = (f"count < {AGENT_BOUND}", galTransitions["initialTrans"][1])
+    return ReachabilityExplorer.from_gal_transitions(galVariables, galTransitions).net, unsafeMarkings
+
+
+# The unsafe markings over all states, like check_system_safety builds them, and
+# random markings of up to AGENT_BOUND agents, some reachable and some not.
+def targets(net, unsafeMarkings, rng):
+    states = [place for place in net.places if place != "count"]
+    result = [{state: marking.get(state, 0) for state in states} for marking in unsafeMarkings]
+    for _ in range(40):
+        chosen = rng.sample(states, rng.randint(1, len(states)))
+        result.append({state: rng.randint(0, AGENT_BOUND) for state in chosen})
+    return result
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_reduction_keeps_verdicts(seed):
+    net, unsafeMarkings = generated_net(seed)
+    checked = targets(net, unsafeMarkings, random.Random(seed))
+
+    full = ReachabilityExplorer(net)
+    reduced = ReachabilityExplorer(net, reduction=True)
+    assert reduced.search(checked) == full.search(checked)
+    for target in checked:
+        assert reduced.is_reachable(target) == full.is_reachable(target)
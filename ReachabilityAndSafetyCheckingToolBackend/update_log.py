@@ -0,0 +1,124 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+LEVELS = {"debug": 10, "info": 20, "success": 20, "warning": 30, "error": 40}
+
+
+class _JobLog:
+    __slots__ = ("entries", "dropped", "level", "finished_at")
+
+    def __init__(self, max_entries, level):
+        self.entries = deque(maxlen=max_entries)
+        self.dropped = 0
+        self.level = level
+        self.finished_at = None
+
+
+# Progress log of every job. Updates below a job's level are discarded when
+# they are added, each job keeps only its newest `max_entries` updates, and
+# finished jobs are evicted `ttl` seconds after they finish.
+#
+# Cursors count every update ever kept for the job, including the ones the
+# ring buffer has since dropped, so they stay valid as old entries fall off.
+class UpdateLog:
+    def __init__(self, max_entries, ttl, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.changed = threading.Condition()
+        self._jobs = {}
+
+    def open(self, request_id, level="info"):
+        self.evict_expired()
+        with self.changed:
+            self._jobs[request_id] = _JobLog(self.max_entries, LEVELS[level])
+
+    def has(self, request_id):
+        return request_id in self._jobs
+
+    def remove(self, request_id):
+        with self.changed:
+            self._jobs.pop(request_id, None)
+
+    def enabled(self, request_id, update_type):
+        job = self._jobs.get(request_id)
+        return job is None or LEVELS.get(update_type, LEVELS["info"]) >= job.level
+
+    def add(self, request_id, update_type, content):
+        with self.changed:
+            job = self._jobs.get(request_id)
+            if job is None:
+                job = self._jobs[request_id] = _JobLog(self.max_entries, LEVELS["info"])
+            if LEVELS.get(update_type, LEVELS["info"]) < job.level:
+                return
+            if len(job.entries) == self.max_entries:
+                job.dropped += 1
+            job.entries.append({
+                "type": update_type,
+                "content": content,
+                "timestamp": time.time()
+            })
+            self.changed.notify_all()
+
+    def _end(self, job):
+        return job.dropped + len(job.entries)
+
+    # Returns the updates from `cursor` on and the cursor to continue from. If
+    # some of them were already dropped, a warning entry says how many.
+    def read(self, request_id, cursor=0):
+        with self.changed:
+            job = self._jobs.get(request_id)
+            if job is None:
+                return [], cursor
+            updates = []
+            if cursor < job.dropped:
+                updates.append({
+                    "type": "warning",
+                    "content": f"{job.dropped - cursor} earlier updates were dropped",
+                    "timestamp": time.time()
+                })
+                cursor = job.dropped
+            updates.extend(itertools.islice(job.entries, cursor - job.dropped, None))
+            return updates, max(cursor, self._end(job))
+
+    # Like read(), but first waits up to `timeout` seconds for updates after
+    # `cursor` unless finished() says the job is done.
+    def wait(self, request_id, cursor, timeout, finished):
+        deadline = time.time() + timeout
+        with self.changed:
+            while request_id in self._jobs and self._end(self._jobs[request_id]) <= cursor and not finished():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                # Results are set without notifying, so re-check completion at least every second.
+                self.changed.wait(min(remaining, 1.0))
+            return self.read(request_id, cursor)
+
+    def finish(self, request_id):
+        with self.changed:
+            job = self._jobs.get(request_id)
+            if job is not None:
+                job.finished_at = time.time()
+            self.changed.notify_all()
+
+    def evict_expired(self):
+        now = time.time()
+        with self.changed:
+            expired = [request_id for request_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.ttl]
+            for request_id in expired:
+                del self._jobs[request_id]
+        for request_id in expired:
+            if self.on_evict:
+                self.on_evict(request_id)
+        return expired
+
+    def stats(self):
+        with self.changed:
+            return {
+                "jobs": len(self._jobs),
+                "entries": sum(len(job.entries) for job in self._jobs.values()),
+                "dropped": sum(job.dropped for job in self._jobs.values()),
+            }
@@ -24,11 +24,15 @@ export default function CheckWithITS() {
   const [navOpen, setNavOpen] = useState(false);
   const [requestId, setRequestId] = useState(null);
   const [terminalOutput, setTerminalOutput] = useState([]);
-  const [fetchingUpdates, setFetchingUpdates] = useState(false);
   const [processingComplete, setProcessingComplete] = useState(false);
   const [result, setResult] = useState(null);
   const terminalRef = useRef(null);
   const pollingIntervalRef = useRef(null);
+  const updatesCursorRef = useRef(0);
+  // Kept in refs rather than state: the interval callback would otherwise see
+  // the values from the render that started it and let polls overlap.
+  const fetchingUpdatesRef = useRef(false);
+  const activeRequestRef = useRef(null);
 
   const [darkMode, setDarkMode] = useState(
     localStorage.getItem("theme") === "dark"
@@ -75,16 +79,27 @@ export default function CheckWithITS() {
   }, []);
 
   const fetchUpdates = async () => {
-    if (fetchingUpdates || !requestId) return;
+    if (fetchingUpdatesRef.current || !requestId) return;
 
-    setFetchingUpdates(true);
+    fetchingUpdatesRef.current = true;
+    const since = updatesCursorRef.current;
     try {
-      const response = await axios.get(`${BASE_URL}/updates/${requestId}`);
-      console.log(`${BASE_URL}/updates/${requestId}`);
-      const { updates, completed, result } = response.data;
+      const response = await axios.get(`${BASE_URL}/updates/${requestId}`, {
+        params: { since },
+      });
+      // Drop the response if the cursor moved or the terminal was reset meanwhile.
+      if (
+        updatesCursorRef.current !== since ||
+        activeRequestRef.current !== requestId
+      )
+        return;
+      const { updates, next, completed, result } = response.data;
 
       if (updates && updates.length > 0) {
-        setTerminalOutput(updates);
+        setTerminalOutput((previous) => [...previous, ...updates]);
+      }
+      if (next !== undefined) {
+        updatesCursorRef.current = next;
       }
 
       if (completed) {
@@ -102,7 +117,7 @@ export default function CheckWithITS() {
     } catch (error) {
       console.error("Error fetching updates:", error);
     } finally {
-      setFetchingUpdates(false);
+      fetchingUpdatesRef.current = false;
     }
   };
 
@@ -114,6 +129,8 @@ export default function CheckWithITS() {
 
     setLoading(true);
     setTerminalOutput([]);
+    updatesCursorRef.current = 0;
+    activeRequestRef.current = null;
     setRequestId(null);
     setProcessingComplete(false);
     setResult(null);
@@ -135,6 +152,7 @@ export default function CheckWithITS() {
       );
 
       if (response.data && response.data.request_id) {
+        activeRequestRef.current = response.data.request_id;
         setRequestId(response.data.request_id);
         toast.info("Processing started. Updates will appear in the terminal.");
       } else {
@@ -210,6 +228,8 @@ export default function CheckWithITS() {
 
   const clearTerminal = () => {
     setTerminalOutput([]);
+    updatesCursorRef.current = 0;
+    activeRequestRef.current = null;
     setRequestId(null);
     setProcessingComplete(false);
     setResult(null);